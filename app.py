@@ -1,62 +1,349 @@
 import json
-from digest_manager import DigestManager
+from datetime import datetime
+from change_export import ChangeExport
+from change_store import ChangeStore
+from checkpoint import Checkpoint
+from digest_manager import DigestManager, DigestTarget, RollingWindow
+from event_queue import EventQueue
+from filters import DigestFilter
+from planner import plan_run, wait_for_budget
+from response_cache import ResponseCache
+from state_store import STATE_FILE, StateStore
+import datetimehelper
+import shard
 import os
+import sys
 
 required_setting_fields = ["digest_issue", "ignored_issues"]
+DEFAULT_OVERLAP_MINUTES = 5
+SUPPORTED_ITEM_TYPES = ["issue", "pull_request", "discussion"]
+SUPPORTED_SOURCES = ["search", "repository", "auto"]
 MAX_COMMENT_SIZE = 65536
+DEFAULT_MAX_THROTTLE_MINUTES = 15
 
-lookup_repo = os.environ["GIT_REPO"]
-digest_dir = os.environ["DIGEST_SAVE_DIR"]
-curr_repo = os.environ["GITHUB_REPOSITORY"]
+def get_file_prefix(digest_dir: str, lookup_repo: str) -> str:
+    """
+    get_file_prefix returns the prefix of the files kept for a repository in the digest directory.
 
-if digest_dir[-1] != "/":
-    digest_dir += "/"
+    args:
+        digest_dir: str - the directory to save the digest files in
+        lookup_repo: str - the repository the digest is for
+    """
+    if digest_dir[-1] != "/":
+        digest_dir += "/"
+    return f"{digest_dir}{'-'.join(lookup_repo.split('/'))}.digest"
 
-savefile = f"{digest_dir}{'-'.join(lookup_repo.split('/'))}.digest.setting.json"
-def create_digest_setting():
+def default_setting() -> dict:
+    return {
+        "digest_issue": "",
+        "ignored_issues": [],
+        "last_watermark": "",
+        "overlap_minutes": DEFAULT_OVERLAP_MINUTES,
+        "digested": {},
+        "item_types": ["issue"]
+    }
+
+def open_store(digest_dir: str) -> StateStore:
+    # the checkpoint and the other files of a repository are written next to the store before it is first saved
     os.makedirs(digest_dir, exist_ok=True)
-    with open(savefile, 'w') as f:
-        json.dump({
-            "digest_issue": "",
-            "ignored_issues": []
-        }, f, indent=4)
-
-if not os.path.exists(savefile):
-    create_digest_setting()
-
-with open(savefile, 'r') as f:
-    try:
-        setting = json.load(f)
-        # ensure setting have all the required fields
-        for field in required_setting_fields:
-            if field not in setting:
-                print("Missing field detected, starting from scratch!")
-                raise KeyError(f"Missing field {field} in {savefile}")
-
-    except (json.decoder.JSONDecodeError ,KeyError) as e:
-        create_digest_setting()
-        with open(savefile, 'r') as f:
-            setting = json.load(f)
-
-
-ql = DigestManager(
-    lookup_repo,
-    curr_repo,
-    setting["digest_issue"],
-    ignored_issues=setting["ignored_issues"]
-    )
-
-issues = ql.get_result()
-issues = [issue for issue in issues if issue.total_changes > 0] # remove issues that is not changed
-
-if (issues):
-    ql.send_data(issues)
-else:
-    print("No changes detected, skipping digest update.")
-
-
-setting["digest_issue"] = ql.digest_issue
-setting["ignored_issues"] = ql.ignored_issues
-
-with open(savefile, 'w') as f:
-    json.dump(setting, f, indent=4)
+    return StateStore(os.path.join(digest_dir, STATE_FILE))
+
+def load_setting(store: StateStore, digest_dir: str, lookup_repo: str) -> dict:
+    """
+    load_setting returns the digest setting of a repository from the state store, moving the older
+    per repository setting file into the store if there is one.
+
+    args:
+        store: StateStore - the state store of the digest directory
+        digest_dir: str - the directory to save the digest files in
+        lookup_repo: str - the repository the digest is for
+    """
+    setting = store.get(lookup_repo, f"{get_file_prefix(digest_dir, lookup_repo)}.setting.json", default_setting())
+    # a setting missing the digest issue would post to a new one, so it is never reset
+    for field in required_setting_fields:
+        if field not in setting:
+            print(f"Missing field {field} in the setting of {lookup_repo}, fix or remove it to start over.", file=sys.stderr)
+            exit(1)
+    return setting
+
+def build_manager(lookup_repo: str, curr_repo: str, setting: dict, prefix: str, create_issues: bool = True) -> DigestManager:
+    """
+    build_manager creates the DigestManager described by the digest setting.
+
+    args:
+        lookup_repo: str - the repository to monitor
+        curr_repo: str - the repository to post the digest to
+        setting: dict - the digest setting
+        prefix: str - the prefix of the files kept for the repository
+        create_issues: bool - whether to create the missing digest issues
+    """
+    item_types = [item_type for item_type in setting.get("item_types", ["issue"]) if item_type in SUPPORTED_ITEM_TYPES]
+    if len(item_types) != len(setting.get("item_types", ["issue"])):
+        print(f"Unsupported item types ignored, supported types are {SUPPORTED_ITEM_TYPES}.", file=sys.stderr)
+    if not item_types:
+        item_types = ["issue"]
+
+    source = setting.get("source", "search")
+    if source not in SUPPORTED_SOURCES:
+        print(f"Unsupported source {source} ignored, supported sources are {SUPPORTED_SOURCES}.", file=sys.stderr)
+        source = "search"
+
+    targets = [
+        DigestTarget(target["name"], target.get("digest_issue", ""), DigestFilter(target.get("filters")))
+        for target in setting.get("targets", [])
+    ]
+    rolling_windows = [
+        RollingWindow(window["name"], window.get("digest_issue", ""), window["days"], window.get("last_posted", ""))
+        for window in setting.get("rolling_windows", [])
+    ]
+
+    return DigestManager(
+        lookup_repo,
+        curr_repo,
+        setting["digest_issue"],
+        ignored_issues=setting["ignored_issues"],
+        last_watermark=setting.get("last_watermark", ""),
+        overlap=setting.get("overlap_minutes", DEFAULT_OVERLAP_MINUTES),
+        digested=setting.get("digested", {}),
+        checkpoint=Checkpoint(f"{prefix}.checkpoint.jsonl"),
+        filters=DigestFilter(setting.get("filters")),
+        item_types=item_types,
+        targets=targets,
+        change_store=ChangeStore(f"{prefix}.changes"),
+        rolling_windows=rolling_windows,
+        event_queue=EventQueue(f"{prefix}.queue.jsonl"),
+        cache=ResponseCache(f"{prefix}.cache.json"),
+        create_issues=create_issues,
+        source=source,
+        edit_history=setting.get("edit_diffs", 0),
+        export=ChangeExport(f"{prefix}.export") if setting.get("export", False) else None
+        )
+
+def record_issues(store: StateStore, setting: dict, ql: DigestManager):
+    """
+    record_issues saves the digest issues created by the manager right away, so a run that fails later
+    does not leave them unrecorded and the next run does not look them up or create them again.
+
+    args:
+        store: StateStore - the state store holding the setting
+        setting: dict - the digest setting, this will be mutated in place
+        ql: DigestManager - the manager that created the digest issues
+    """
+    setting["digest_issue"] = ql.digest_issue
+    for target_setting, target in zip(setting.get("targets", []), ql.targets):
+        target_setting["digest_issue"] = target.digest_issue
+    for window_setting, window in zip(setting.get("rolling_windows", []), ql.rolling_windows):
+        window_setting["digest_issue"] = window.digest_issue
+    setting["ignored_issues"] = ql.ignored_issues
+    # the store is only written if the setting changed, which is when an issue was created or the repository is new
+    store.save()
+
+def update_setting(setting: dict, ql: DigestManager, issues: list, posted: bool = True):
+    """
+    update_setting writes the state of the finished run back into the digest setting.
+    The digest issues were already recorded by record_issues.
+
+    args:
+        setting: dict - the digest setting, this will be mutated in place
+        ql: DigestManager - the manager of the finished run
+        issues: list[GitIssue] - the issues sent in the digest
+        posted: bool - whether a digest was posted, a run that posted nothing keeps the previous window
+    """
+    for window_setting, window in zip(setting.get("rolling_windows", []), ql.rolling_windows):
+        window_setting["last_posted"] = window.last_posted
+    setting.setdefault("overlap_minutes", DEFAULT_OVERLAP_MINUTES)
+    if not posted and setting.get("last_watermark"):
+        # the next run searches the same window again, so the state store is not rewritten for a quiet run
+        return
+    ql.mark_digested(issues)
+    setting["last_watermark"] = ql.watermark
+    setting["digested"] = ql.digested
+
+def run_digest(lookup_repo: str, curr_repo: str, digest_dir: str, dry_run: bool = False) -> DigestManager:
+    """
+    run_digest fetches the changes of a repository and posts the digest.
+    In a dry run, it only prints the projected cost of the run without changing anything.
+
+    args:
+        lookup_repo: str - the repository to monitor
+        curr_repo: str - the repository to post the digest to
+        digest_dir: str - the directory to save the digest files in
+        dry_run: bool - only plan the run
+
+    returns:
+        DigestManager - the manager of the finished run
+    """
+    prefix = get_file_prefix(digest_dir, lookup_repo)
+    store = open_store(digest_dir)
+    setting = load_setting(store, digest_dir, lookup_repo)
+    ql = build_manager(lookup_repo, curr_repo, setting, prefix, not dry_run)
+    if not dry_run:
+        record_issues(store, setting, ql)
+
+    if dry_run or setting.get("budget_check", False):
+        plan = plan_run(ql)
+        print(plan.report())
+        if dry_run:
+            if plan.exhausts_budget:
+                print("The run would exhaust the rate limit.", file=sys.stderr)
+            return ql
+        if not wait_for_budget(plan, setting.get("max_throttle_minutes", DEFAULT_MAX_THROTTLE_MINUTES)):
+            print("Refusing to run the digest.", file=sys.stderr)
+            exit(1)
+
+    issues = ql.get_result()
+    publish(ql, setting, issues)
+    store.save()
+    finish_run(ql, setting)
+    return ql
+
+def publish(ql: DigestManager, setting: dict, issues: list):
+    """
+    publish posts the digest of the fetched issues and updates the state of the finished run.
+    The caller saves the state store and then calls finish_run.
+
+    args:
+        ql: DigestManager - the manager of the run
+        setting: dict - the digest setting, this will be mutated in place
+        issues: list[GitIssue] - the fetched issues
+    """
+    issues = [issue for issue in issues if issue.total_changes > 0] # remove issues that is not changed
+    ql.record_changes(issues)
+    if ql.export:
+        # issues that were not streamed while fetching, e.g. the merged results of shards
+        ql.export.begin(ql.time_range)
+        for issue in issues:
+            ql.export.write(ql.target_repo, issue)
+    ql.read_content_edits(issues)
+
+    posted = bool(issues or ql.due_windows())
+    if posted:
+        ql.send_data(issues)
+    else:
+        print("No changes detected, skipping digest update.")
+
+    update_setting(setting, ql, issues, posted)
+
+def finish_run(ql: DigestManager, setting: dict):
+    """
+    finish_run drops the records of the run that are no longer needed. It must only be called once the state
+    of the run is saved, since a run that fails before that is resumed from the checkpoint, and the hashes
+    of its posted digests in the checkpoint keep the resumed run from posting them again.
+
+    args:
+        ql: DigestManager - the manager of the finished run
+        setting: dict - the saved digest setting
+    """
+    ql.checkpoint.clear()
+    # a quiet run keeps the watermark, the events of the window it searched are still needed by the next run
+    ql.event_queue.consume(datetimehelper.convertToDateTime(setting["last_watermark"]) - ql.overlap)
+    if ql.export:
+        ql.export.commit()
+    ql.cache.save()
+    print(ql.cache.report)
+
+def run_shard(repos: list[str], curr_repo: str, digest_dir: str, index: int, count: int, split: int, split_end: datetime = None):
+    """
+    run_shard fetches the time windows assigned to one of the parallel runners and writes the items found
+    as partial results. Nothing is posted and the settings are not changed, that is left to merge_shards.
+
+    args:
+        repos: list[str] - the repositories to monitor
+        curr_repo: str - the repository to post the digest to
+        digest_dir: str - the directory to save the digest files in
+        index: int - the index of the shard, starting from 0
+        count: int - the number of shards
+        split: int - the number of time windows each repository is split into
+        split_end: datetime - the time the windows are split up to, shared by all shards and the merge of a run,
+            default to the start of the current hour
+    """
+    split_end = split_end or shard.window_end(datetimehelper.get_now())
+    store = open_store(digest_dir)
+    for lookup_repo, window in shard.partition(repos, split, index, count):
+        prefix = get_file_prefix(digest_dir, lookup_repo)
+        setting = load_setting(store, digest_dir, lookup_repo)
+        ql = build_manager(lookup_repo, curr_repo, setting, prefix, create_issues=False)
+        # the shards run in parallel, so the checkpoint, event queue and export of the repository are left to the merge
+        ql.checkpoint = ql.event_queue = ql.export = None
+        if not setting.get("last_watermark"):
+            # without a watermark the start is counted back from the split end, so that the shards and the merge agree
+            ql.update_last_change_date("", split_end)
+        ql.search_window = shard.search_window(ql.last_update_time, split_end, window, split)
+        issues = ql.get_result()
+        shard.write_partial(prefix, window, split, ql.time_range, ql.search_window, issues)
+        print(f"Shard {index} found {len(issues)} items of {lookup_repo} in window {window + 1}/{split}.")
+
+def merge_shards(repos: list[str], curr_repo: str, digest_dir: str, split_end: datetime = None):
+    """
+    merge_shards combines the partial results of the shards, posts the digest and saves the settings of each repository.
+    A repository is skipped if the partial results of some time windows are missing.
+
+    args:
+        repos: list[str] - the repositories to monitor
+        curr_repo: str - the repository to post the digest to
+        digest_dir: str - the directory to save the digest files in
+        split_end: datetime - the split end passed to the shards, default to the start of the current hour
+    """
+    split_end = split_end or shard.window_end(datetimehelper.get_now())
+    missing = []
+    store = open_store(digest_dir)
+    for lookup_repo in sorted(set(repos)):
+        prefix = get_file_prefix(digest_dir, lookup_repo)
+        setting = load_setting(store, digest_dir, lookup_repo)
+        partials = shard.read_partials(prefix)
+        if not partials:
+            missing.append(lookup_repo)
+            continue
+        ql = build_manager(lookup_repo, curr_repo, setting, prefix)
+        record_issues(store, setting, ql)
+        if not setting.get("last_watermark"):
+            ql.update_last_change_date("", split_end)
+        if partials[0]["time_start"] != datetimehelper.format_to_utc(ql.last_update_time):
+            # the watermark moved since the shards ran, the partial results are stale
+            missing.append(lookup_repo)
+            continue
+        ql.fetch_start, issues = shard.merge_partials(partials, ql.digested)
+        issues.sort(key=lambda issue: (ql.item_types.index(issue.item_type), issue.number))
+        publish(ql, setting, issues)
+        # saved after each repository, so the repositories already posted are kept if a later one fails
+        store.save()
+        finish_run(ql, setting)
+        shard.remove_partials(prefix)
+
+    if missing:
+        print(f"Partial results of {', '.join(missing)} are missing or stale, run the shards again.", file=sys.stderr)
+        exit(1)
+
+def ingest_event(lookup_repo: str, digest_dir: str, event_name: str, event_path: str):
+    """
+    ingest_event only queues the event that triggered the action, the digest is built by the scheduled run.
+
+    args:
+        lookup_repo: str - the repository to monitor
+        digest_dir: str - the directory to save the digest files in
+        event_name: str - the name of the event
+        event_path: str - the path of the event payload
+    """
+    with open(event_path, 'r') as f:
+        EventQueue(f"{get_file_prefix(digest_dir, lookup_repo)}.queue.jsonl").ingest(event_name, json.load(f))
+
+if __name__ == "__main__":
+    lookup_repo = os.environ["GIT_REPO"]
+    digest_dir = os.environ["DIGEST_SAVE_DIR"]
+    curr_repo = os.environ["GITHUB_REPOSITORY"]
+    mode = os.environ.get("DIGEST_MODE", "digest")
+
+    if mode == "ingest":
+        ingest_event(lookup_repo, digest_dir, os.environ["GITHUB_EVENT_NAME"], os.environ["GITHUB_EVENT_PATH"])
+    elif mode in ("shard", "merge"):
+        # several repositories can be sharded together, separated by commas or whitespace
+        repos = lookup_repo.replace(",", " ").split()
+        split_end = os.environ.get("SHARD_END")
+        split_end = datetimehelper.convertToDateTime(split_end) if split_end else None
+        if mode == "shard":
+            run_shard(repos, curr_repo, digest_dir, int(os.environ["SHARD_INDEX"]), int(os.environ["SHARD_COUNT"]),
+                      int(os.environ.get("SHARD_SPLIT", "1")), split_end)
+        else:
+            merge_shards(repos, curr_repo, digest_dir, split_end)
+    else:
+        run_digest(lookup_repo, curr_repo, digest_dir, os.environ.get("DIGEST_DRY_RUN", "false").lower() == "true")
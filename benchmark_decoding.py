@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import time
+import requests
+
+# the responses are built locally, no request is sent
+os.environ.setdefault("GIT_SECRET", "")
+os.environ.setdefault("TIMEZONE", "UTC")
+from gql_queries import handle_errors
+
+def search_page(issues: int, comments: int, body_size: int) -> requests.Response:
+    """
+    search_page builds a response holding one page of the main search query.
+
+    args:
+        issues: int - the number of issues on the page
+        comments: int - the number of comments of every issue
+        body_size: int - the length of every issue body
+
+    returns:
+        requests.Response - the response with the encoded page
+    """
+    created = "2024-01-01T00:00:00Z"
+    nodes = []
+    for n in range(issues):
+        nodes.append({
+            "title": f"Issue {n}", "id": f"I_{n}", "url": f"https://github.com/owner/repo/issues/{n}", "number": n,
+            "body": "x" * body_size, "createdAt": created, "updatedAt": created, "author": {"login": "author"},
+            "lastEditedAt": None, "editor": None, "state": "OPEN", "closed": False,
+            "comments": {"totalCount": comments, "pageInfo": {"endCursor": "cursor", "hasNextPage": False},
+                         "nodes": [{"id": f"C_{n}_{i}", "author": {"login": "commenter"}, "createdAt": created,
+                                    "url": f"https://github.com/owner/repo/issues/{n}#issuecomment-{i}",
+                                    "lastEditedAt": None, "editor": None, "body": f"comment {i}"}
+                                   for i in range(comments)]}})
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response._content = json.dumps({"data": {"main": {"pageInfo": {"endCursor": "cursor", "hasNextPage": False},
+                                                      "nodes": nodes}}}).encode()
+    return response
+
+def decode_twice(response: requests.Response) -> dict:
+    """
+    decode_twice is the decoding before handle_errors returned the data: the errors were checked on one
+    decode and the data read from another.
+    """
+    if 'errors' in response.json():
+        exit(1)
+    return response.json()["data"]
+
+def measure(decode, response: requests.Response, repeat: int) -> float:
+    """
+    measure returns the average seconds taken to decode the response.
+
+    args:
+        decode: Callable[[requests.Response], dict] - the decoding to measure
+        response: requests.Response - the response to decode
+        repeat: int - the number of times to decode it
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(response)
+    return (time.perf_counter() - start) / repeat
+
+if __name__ == "__main__":
+    # usage: python benchmark_decoding.py [repeat]
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for issues, comments, body_size in ((25, 10, 500), (100, 100, 2000)):
+        response = search_page(issues, comments, body_size)
+        twice = measure(decode_twice, response, repeat)
+        once = measure(handle_errors, response, repeat)
+        print(f"{len(response.content) / 1e6:.1f} MB page ({issues} issues, {comments} comments each): "
+              f"decoded twice {twice * 1000:.1f} ms, once {once * 1000:.1f} ms")
@@ -0,0 +1,64 @@
+"""
+benchmark_sanitize compares sanitize_markdown with the replace chain it took over from, on bodies of 1 MiB by default.
+
+sanitize_markdown stays a few times slower than the chain: it walks the body line by line to follow code fences
+and keep the quote under the limit, and lines with code, links or urls are scanned again to put their @ back.
+The chain cannot do either, it neutralised every @ and quoted code blocks and emails wrongly. Cutting a body to
+32 KiB only quotes the lines that fit, which leaves splitting the body into lines as most of the cost.
+"""
+import sys
+import time
+from stringhelper import sanitize_markdown
+
+def replace_chain(x: str) -> str:
+    """
+    replace_chain is the quoting used before sanitize_markdown: every @ was replaced, including the ones in code,
+    links and emails, and the lines were quoted by a second replace.
+    """
+    return ">" + x.replace("@", "＠").replace("\n", "\n>")
+
+def make_bodies(size: int) -> dict[str, str]:
+    """
+    make_bodies builds bodies of about the given size with different content.
+
+    args:
+        size: int - the length of each body
+    """
+    lines = {
+        "prose": "The quick brown fox jumps over the lazy dog, then it does it again and again.",
+        "mentions": "Thanks @alice, see https://github.com/owner/repo/issues/1 and mail bob@example.com about it.",
+        "dense mentions": "@alice @bob @carol @dave @erin @frank @grace @heidi @ivan @judy @mallory @oscar",
+        "code": "```\nconst handle = '@scope/package'; // @ts-ignore\n```",
+        "single line": "word " * 8,
+    }
+    bodies = {}
+    for name, line in lines.items():
+        separator = " " if name == "single line" else "\n"
+        bodies[name] = separator.join([line] * (size // (len(line) + 1)))
+    return bodies
+
+def measure(func, body: str, repeat: int) -> float:
+    """
+    measure returns the average seconds taken by the function on the body.
+
+    args:
+        func: Callable[[str], str] - the function to measure
+        body: str - the body to pass
+        repeat: int - the number of runs
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(body)
+    return (time.perf_counter() - start) / repeat
+
+if __name__ == "__main__":
+    # usage: python benchmark_sanitize.py [size] [repeat]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{size // 1024} KiB bodies, mean of {repeat} runs")
+    for name, body in make_bodies(size).items():
+        chain = measure(replace_chain, body, repeat)
+        sanitized = measure(sanitize_markdown, body, repeat)
+        limited = measure(lambda x: sanitize_markdown(x, 32768), body, repeat)
+        print(f"- {name}: replace chain {chain * 1000:.1f} ms, sanitize_markdown {sanitized * 1000:.1f} ms "
+              f"({sanitized / chain:.1f}x), cut to 32 KiB {limited * 1000:.2f} ms")
@@ -0,0 +1,48 @@
+import sys
+import time
+import datetimehelper
+from digest_manager import DigestManager
+import gql_queries
+
+def measure(repo: str, source: str, watermark: str) -> tuple[int, float, int]:
+    """
+    measure fetches the issues of a repository updated since the watermark from one source.
+
+    args:
+        repo: str - the repository to fetch, in the format of owner/repo
+        source: str - "search" or "repository"
+        watermark: str - the UTC start of the window
+
+    returns:
+        tuple[int, float, int] - the number of requests, the seconds taken and the number of issues found
+    """
+    requests = 0
+    post = gql_queries.session.post
+
+    def counted_post(*args, **kwargs):
+        nonlocal requests
+        requests += 1
+        return post(*args, **kwargs)
+
+    gql_queries.session.post = counted_post
+    try:
+        # the digest issue is only used when posting, nothing is posted here
+        ql = DigestManager(repo, repo, "", last_watermark=watermark, overlap=0, create_issues=False, source=source)
+        start = time.monotonic()
+        issues = ql.get_result()
+        return requests, time.monotonic() - start, len(issues)
+    finally:
+        gql_queries.session.post = post
+
+if __name__ == "__main__":
+    # usage: GIT_SECRET=<token> TIMEZONE=UTC python benchmark_sources.py owner/repo [days]
+    if len(sys.argv) < 2:
+        print("usage: python benchmark_sources.py owner/repo [days]", file=sys.stderr)
+        exit(1)
+    repo = sys.argv[1]
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    watermark = datetimehelper.format_to_utc(datetimehelper.get_n_day_prior(days))
+    print(f"Issues of {repo} updated since {watermark}")
+    for source in ("search", "repository"):
+        requests, duration, found = measure(repo, source, watermark)
+        print(f"- {source}: {found} issues in {requests} requests, {duration:.2f}s")
@@ -0,0 +1,159 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Iterator
+from git_structures import GitIssue
+import datetimehelper
+
+FILE_SUFFIX = ".ndjson.gz"
+FILE_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+INDEX_FILE = "index.jsonl"
+
+class ChangeExport:
+    """
+    ChangeExport writes the normalized changes of every run for other tools, one compressed NDJSON file per run.
+    Each line is one change of an item, a comment or a timeline event. The changes are written while the run fetches,
+    and the file is only added to the index once the run is complete, so readers never see a partial run.
+
+    args:
+        directory: str - the directory to export the changes to
+    """
+    directory: str
+    path: str | None
+    file: gzip.GzipFile | None
+    time_range: tuple[datetime, datetime] | None
+    written: set[str]
+    records: int
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = None
+        self.file = None
+        self.time_range = None
+        self.written = set()
+        self.records = 0
+
+    def begin(self, time_range: tuple[datetime, datetime]):
+        """
+        begin starts the export of a run, an export already started is kept.
+
+        args:
+            time_range: tuple[datetime, datetime] - the window of the run
+        """
+        if self.file:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(f"{FILE_SUFFIX}.tmp"):
+                # left by a run that failed before it completed
+                os.remove(os.path.join(self.directory, name))
+        self.time_range = time_range
+        self.path = os.path.join(self.directory, time_range[1].astimezone(datetimehelper.utc).strftime(FILE_TIME_FORMAT) + FILE_SUFFIX)
+        self.file = gzip.open(f"{self.path}.tmp", 'wt', encoding="utf-8")
+        self.written = set()
+        self.records = 0
+
+    def write(self, repo: str, issue: GitIssue):
+        """
+        write exports the changes of an issue whose comments and events are all read, an issue is only written once.
+
+        args:
+            repo: str - the repository of the issue
+            issue: GitIssue - the issue to export
+        """
+        if issue.id in self.written:
+            return
+        self.written.add(issue.id)
+        for record in normalize(repo, issue):
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.records += 1
+
+    def commit(self):
+        """
+        commit completes the export of the run and adds it to the index. A run without changes is not exported,
+        so quiet runs leave the export directory unchanged.
+        """
+        if not self.file:
+            return
+        self.file.close()
+        self.file = None
+        if not self.records:
+            os.remove(f"{self.path}.tmp")
+            return
+        os.replace(f"{self.path}.tmp", self.path)
+        with open(os.path.join(self.directory, INDEX_FILE), 'a') as f:
+            f.write(json.dumps({
+                "file": os.path.basename(self.path),
+                "start": datetimehelper.format_to_utc(self.time_range[0]),
+                "end": datetimehelper.format_to_utc(self.time_range[1]),
+                "records": self.records
+            }) + "\n")
+
+    def read(self, time_range: tuple[datetime, datetime]) -> Iterator[dict]:
+        """
+        read yields the exported changes made within the time range, only the files of the runs
+        overlapping the time range are opened.
+
+        args:
+            time_range: tuple[datetime, datetime] - the time range to read
+        """
+        index = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(index):
+            return
+        start, end = (datetimehelper.format_to_utc(dt) for dt in time_range)
+        with open(index, 'r') as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+        for run in runs:
+            if run["end"] < start or run["start"] > end:
+                continue
+            with gzip.open(os.path.join(self.directory, run["file"]), 'rt', encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if start <= record["timestamp"] <= end:
+                        yield record
+
+def normalize(repo: str, issue: GitIssue) -> Iterator[dict]:
+    """
+    normalize yields the changes of an issue as flat records.
+
+    args:
+        repo: str - the repository of the issue
+        issue: GitIssue - the issue to normalize
+    """
+    item = {"repo": repo, "item_type": issue.item_type, "number": issue.number}
+    if issue.contains_changes:
+        yield {
+            **item,
+            "kind": "item",
+            "id": issue.id,
+            "url": issue.url,
+            "title": issue.title,
+            "author": issue.last_change_author,
+            "timestamp": datetimehelper.format_to_utc(issue.last_change_date),
+            "status": issue.get_status_str(issue.time_range),
+            "closed": issue.closed,
+            "labels": issue.labels,
+            "body": issue.body,
+        }
+    for comment in issue.comments:
+        yield {
+            **item,
+            "kind": "comment",
+            "id": comment.id,
+            "url": comment.source_link,
+            "author": comment.last_change_author,
+            "timestamp": datetimehelper.format_to_utc(comment.last_change_date),
+            "status": comment.get_status_str(comment.time_range),
+            "body": comment.body,
+        }
+    for event in issue.events:
+        yield {
+            **item,
+            "kind": "event",
+            "id": event.id,
+            "event_type": event.event_type,
+            "author": event.actor,
+            "timestamp": datetimehelper.format_to_utc(event.created_at),
+            "action": event.action,
+        }
@@ -0,0 +1,106 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from git_structures import GitIssue, item_classes
+import datetimehelper
+
+FILE_SUFFIX = ".json.gz"
+FILE_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+class ChangeStore:
+    """
+    ChangeStore keeps the change set of every run on disk, one compressed file per run named after the end of its window.
+    Digests over longer windows (e.g. weekly) are built by merging the stored change sets instead of fetching again.
+
+    args:
+        directory: str - the directory to store the change sets in
+    """
+    directory: str
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, end: datetime) -> str:
+        return os.path.join(self.directory, end.astimezone(datetimehelper.utc).strftime(FILE_TIME_FORMAT) + FILE_SUFFIX)
+
+    def _stored_ends(self) -> list[tuple[datetime, str]]:
+        """
+        _stored_ends returns the end of the window and the path of every stored change set, oldest first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        ret = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(FILE_SUFFIX):
+                continue
+            end = datetime.strptime(name[:-len(FILE_SUFFIX)], FILE_TIME_FORMAT).replace(tzinfo=datetimehelper.utc)
+            ret.append((end, os.path.join(self.directory, name)))
+        return sorted(ret)
+
+    def record(self, time_range: tuple[datetime, datetime], issues: list[GitIssue]):
+        """
+        record stores the change set of a run.
+
+        args:
+            time_range: tuple[datetime, datetime] - the window of the run
+            issues: list[GitIssue] - the changed issues of the run
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(time_range[1])
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, 'wt', encoding="utf-8") as f:
+            json.dump({
+                "start": datetimehelper.format_to_utc(time_range[0]),
+                "end": datetimehelper.format_to_utc(time_range[1]),
+                "items": [issue.to_dict() for issue in issues]
+            }, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def evict(self, before: datetime):
+        """
+        evict deletes the change sets whose window ended before the given time.
+
+        args:
+            before: datetime - change sets ending before this are deleted
+        """
+        for end, path in self._stored_ends():
+            if end < before:
+                os.remove(path)
+
+    def merge(self, time_range: tuple[datetime, datetime]) -> list[GitIssue]:
+        """
+        merge builds the issues changed within the time range from the stored change sets.
+
+        An item that changed in several runs is only reported once, in its latest version.
+        Comments and timeline events of an issue are combined across runs.
+
+        args:
+            time_range: tuple[datetime, datetime] - the time range to build the issues for
+
+        returns:
+            list[GitIssue] - the changed issues sorted by number
+        """
+        merged: dict[str, dict] = {}
+        for end, path in self._stored_ends():
+            if end <= time_range[0]:
+                continue
+            with gzip.open(path, 'rt', encoding="utf-8") as f:
+                items = json.load(f)["items"]
+            for item in items:
+                previous = merged.get(item["id"])
+                comments = previous["comments"] if previous else {}
+                events = previous["events"] if previous else {}
+                comments.update((comment["id"], comment) for comment in item["comments"]["nodes"])
+                events.update((event["id"], event) for event in item["timelineItems"]["nodes"])
+                merged[item["id"]] = {"item": item, "comments": comments, "events": events}
+
+        ret = []
+        for entry in merged.values():
+            raw = dict(entry["item"])
+            raw["comments"] = {"pageInfo": {"endCursor": None, "hasNextPage": False}, "nodes": list(entry["comments"].values())}
+            raw["timelineItems"] = {"pageInfo": {"endCursor": None, "hasNextPage": False}, "nodes": list(entry["events"].values())}
+            issue = item_classes[raw["item_type"]](raw, time_range)
+            if issue.total_changes > 0:
+                ret.append(issue)
+        return sorted(ret, key=lambda issue: issue.number)
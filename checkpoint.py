@@ -0,0 +1,123 @@
+import json
+import os
+
+class Checkpoint:
+    """
+    Checkpoint is an append-only record of the pagination state of a digest run.
+
+    Every request made while fetching appends one JSON line to the file, so a run that fails halfway
+    can be resumed from where it stopped instead of starting again from zero. The first line
+    describes the window being fetched, a checkpoint is only resumed if the window start matches.
+
+    args:
+        path: str - the path of the checkpoint file
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _replace(self, lines: list[dict]):
+        """
+        _replace atomically replaces the checkpoint file with the given records.
+
+        args:
+            lines: list[dict] - the records to write
+        """
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            for line in lines:
+                f.write(json.dumps(line) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def begin(self, window_start: str, window_end: str):
+        """
+        begin starts a new checkpoint for the given window, discarding any previous one.
+
+        args:
+            window_start: str - the UTC start of the window
+            window_end: str - the UTC end of the window
+        """
+        self._replace([{"type": "window", "start": window_start, "end": window_end}])
+
+    def append(self, record: dict):
+        """
+        append adds a record to the checkpoint and flushes it to disk.
+
+        args:
+            record: dict - the record to add
+        """
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add_page(self, item_type: str, cursor: str, complete: bool, nodes: list[dict]):
+        """
+        add_page records a page of the main query for one item type.
+
+        args:
+            item_type: str - the item type of the page
+            cursor: str - the cursor after this page
+            complete: bool - whether this was the last page
+            nodes: list[dict] - the raw issues of this page
+        """
+        self.append({"type": "page", "item_type": item_type, "cursor": cursor, "complete": complete, "nodes": nodes})
+
+    def add_pages(self, issue_id: str, pages: dict[str, dict]):
+        """
+        add_pages records the pages of comments and timeline events read for an issue.
+
+        args:
+            issue_id: str - the id of the issue
+            pages: dict[str, dict] - the raw pages by connection name
+        """
+        self.append({"type": "pages", "issue": issue_id, "pages": pages})
+
+    def add_posts(self, posts: dict[str, str]):
+        """
+        add_posts records the hashes of the digest comments about to be posted.
+
+        args:
+            posts: dict[str, str] - the hash of the digest comment by digest issue
+        """
+        self.append({"type": "posts", "posts": posts})
+
+    def load(self, window_start: str) -> list[dict] | None:
+        """
+        load reads the checkpoint for the given window.
+
+        A partially written last line (the run crashed while writing it) is dropped from the file
+        so that new records can be appended after the valid ones.
+
+        args:
+            window_start: str - the UTC start of the window
+
+        returns:
+            list[dict] | None - the records of the checkpoint, starting with the window record,
+            or None if there is no checkpoint for this window
+        """
+        if not os.path.exists(self.path):
+            return None
+        records = []
+        truncated = False
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.decoder.JSONDecodeError:
+                    truncated = True
+                    break
+        if not records or records[0].get("type") != "window" or records[0]["start"] != window_start:
+            return None
+        if truncated:
+            self._replace(records)
+        return records
+
+    def clear(self):
+        """
+        clear atomically empties the checkpoint, this should be called once the digest is posted.
+        """
+        self._replace([])
@@ -0,0 +1,243 @@
+import json
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+from app import run_digest
+import datetimehelper
+import renderer
+
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)] # minute, hour, day of month, month, day of week
+
+def parse_cron_field(field: str, low: int, high: int) -> set[int]:
+    """
+    parse_cron_field parses a single field of a cron expression, supporting *, lists, ranges and steps.
+
+    args:
+        field: str - the field to parse
+        low: int - the smallest value of the field
+        high: int - the largest value of the field
+    """
+    ret = set()
+    for part in field.split(","):
+        value, _, step = part.partition("/")
+        if value == "*":
+            start, end = low, high
+        elif "-" in value:
+            start, end = [int(x) for x in value.split("-")]
+        else:
+            start = end = int(value)
+            if step:
+                end = high
+        if start < low or end > high + (1 if high == 6 else 0):
+            raise ValueError(f"Cron field {field} out of range {low}-{high}")
+        ret.update(range(start, end + 1, int(step) if step else 1))
+    if high == 6 and 7 in ret:
+        # both 0 and 7 are sunday
+        ret.discard(7)
+        ret.add(0)
+    return ret
+
+class CronSchedule:
+    """
+    CronSchedule is a parsed 5 field cron expression, evaluated in UTC.
+
+    args:
+        expression: str - the cron expression, e.g. "0 0 * * *"
+    """
+    expression: str
+    minutes: set[int]
+    hours: set[int]
+    days: set[int]
+    months: set[int]
+    weekdays: set[int]
+    any_day: bool
+    any_weekday: bool
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression {expression} should have 5 fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def matches_day(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            # cron only combines the two fields with "or" when both are restricted
+            return day and weekday
+        return day or weekday
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+        next_run returns the first time strictly after the given time that matches the schedule.
+
+        args:
+            after: datetime - the time to start from
+        """
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.matches_day(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression {self.expression} never matches")
+
+class ScheduledDigest:
+    """
+    ScheduledDigest is a digest run by the daemon on a cron schedule.
+
+    args:
+        setting: dict - the schedule setting with the fields
+            - repo: str - the repository to monitor
+            - local_repo: str - the repository to post the digest to, default to repo
+            - save: str - the directory to save the digest files in, default to .github/digests
+            - cron: str - the cron expression of the schedule
+    """
+    repo: str
+    local_repo: str
+    save: str
+    schedule: CronSchedule
+    next_run: datetime
+    runs: int
+    failures: int
+    last_run: datetime | None
+    last_duration: float
+
+    def __init__(self, setting: dict, now: datetime):
+        self.repo = setting["repo"]
+        self.local_repo = setting.get("local_repo", self.repo)
+        self.save = setting.get("save", ".github/digests")
+        self.schedule = CronSchedule(setting["cron"])
+        self.next_run = self.schedule.next_run(now)
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_duration = 0.0
+
+    def run(self, lock: threading.Lock):
+        """
+        run runs the digest and schedules the next run. Failures are logged and counted, they do not stop the daemon.
+
+        args:
+            lock: threading.Lock - guards the counters read by the metrics, it is not held while the digest runs
+        """
+        start = time.monotonic()
+        with lock:
+            self.last_run = datetimehelper.get_now()
+        failed = False
+        try:
+            run_digest(self.repo, self.local_repo, self.save)
+        except (Exception, SystemExit):
+            # query failures exit the one-shot script, the daemon keeps going
+            failed = True
+            print(f"Digest of {self.repo} failed.", file=sys.stderr)
+            traceback.print_exc()
+        with lock:
+            self.failures += failed
+            self.runs += 1
+            self.last_duration = time.monotonic() - start
+            self.next_run = self.schedule.next_run(datetimehelper.get_now())
+
+class Daemon:
+    """
+    Daemon runs many digest schedules in one process, so that connections, repository ids and
+    rendered issues stay warm between cycles. It also serves /health and /metrics on a local port.
+
+    args:
+        config: dict - the daemon config with the fields
+            - schedules: list[dict] - the schedules, see ScheduledDigest
+            - port: int - the port of the health and metrics endpoint, default to 8080
+    """
+    digests: list[ScheduledDigest]
+    port: int
+    started: datetime
+    lock: threading.Lock
+
+    def __init__(self, config: dict):
+        self.started = datetimehelper.get_now()
+        self.digests = [ScheduledDigest(setting, self.started) for setting in config["schedules"]]
+        self.port = config.get("port", 8080)
+        self.lock = threading.Lock()
+
+    def metrics(self) -> str:
+        """
+        metrics returns the metrics of the daemon in the Prometheus text format.
+        """
+        lines = [
+            f"digest_uptime_seconds {(datetimehelper.get_now() - self.started).total_seconds():.0f}",
+            f"digest_render_cache_hits_total {renderer.render_cache_stats['hits']}",
+            f"digest_render_cache_misses_total {renderer.render_cache_stats['misses']}",
+        ]
+        with self.lock:
+            for digest in self.digests:
+                # several schedules can digest the same repository, the cron expression tells them apart
+                label = f'{{repo="{digest.repo}",schedule="{digest.schedule.expression}"}}'
+                lines.append(f"digest_runs_total{label} {digest.runs}")
+                lines.append(f"digest_failures_total{label} {digest.failures}")
+                lines.append(f"digest_last_duration_seconds{label} {digest.last_duration:.3f}")
+                lines.append(f"digest_next_run_timestamp{label} {digest.next_run.timestamp():.0f}")
+                if digest.last_run:
+                    lines.append(f"digest_last_run_timestamp{label} {digest.last_run.timestamp():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self) -> ThreadingHTTPServer:
+        """
+        serve starts the health and metrics endpoint on a background thread.
+        """
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    body, content_type = json.dumps({"status": "ok", "schedules": len(daemon.digests)}), "application/json"
+                elif self.path == "/metrics":
+                    body, content_type = daemon.metrics(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, format, *args):
+                # keep the daemon log for digest runs
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run_forever(self):
+        """
+        run_forever runs the schedules until the process is stopped.
+        """
+        self.serve()
+        while True:
+            with self.lock:
+                digest = min(self.digests, key=lambda digest: digest.next_run)
+                delay = (digest.next_run - datetimehelper.get_now()).total_seconds()
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            digest.run(self.lock)
+
+if __name__ == "__main__":
+    with open(environ.get("DIGEST_DAEMON_CONFIG", "digest.daemon.json"), 'r') as f:
+        Daemon(json.load(f)).run_forever()
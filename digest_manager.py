@@ -1,6 +1,18 @@
+from collections import Counter
 from datetime import datetime, timedelta
-from git_structures import GitIssue
-from gql_queries import AddComment, LockIssue, ReadIssueLock, UnlockIssue, UpdateIssue, MainQuery, FindRepoId, ReadLastCommentDate, CreateIssue, run_queries, run_mutations
+import hashlib
+import heapq
+import re
+from change_export import ChangeExport
+from change_store import ChangeStore
+from checkpoint import Checkpoint
+from event_queue import EventQueue
+from filters import DigestFilter
+from git_structures import GitIssue, item_classes
+from gql_queries import AddComment, ReadContentEdits, LockIssue, ReadDigestIssue, UnlockIssue, UpdateIssue, UpdatedIssueNumbers, MainQuery, FindRepoId, ReadLastCommentDate, CreateIssue, run_queries, run_mutations
+from packer import hidden_template, pack
+from renderer import render_issues
+from response_cache import ResponseCache
 import datetimehelper
 
 digest_header = """<details>
@@ -9,7 +21,7 @@ digest_header = """<details>
 <p>... contains {all_changes} changes across {issues_changed} issues, since {time_start} (timezone: {tz})</p>
 </summary>
 
-{body}
+{stats}{body}
 
 {additional_issues}
 </details>
@@ -18,12 +30,91 @@ digest_header = """<details>
 additional_issues_template = """[details to some update were omitted due to post length limitations]
 Issues omitted: {links}"""
 
+stats_template = """**Activity:** {activity}
+**Most active:** {top_issues}
+**Top authors:** {top_authors}
+
+"""
+
+TOP_STATS_SIZE = 3 # issues and authors listed in the stats
+
 digest_content = """
 Subscribe to this issue to receive a periodic compilation of latest updates to this issue tracker.
 Unsubscribe from this issue if you are not interested to receive such periodic updates.
 """
 
+# marks a digest comment with the hash of its content, so a digest posted by a request whose response was lost is recognised
+digest_hash_template = "\n<!-- digest-hash: {hash} -->"
+digest_hash_regex = re.compile(r"<!-- digest-hash: ([0-9a-f]+) -->")
+
 MAX_BODY_SIZE = 65536 - 1000 # buffer for the digest header
+RECENT_COMMENTS = 10 # last comments of a digest issue searched for a digest already posted
+MAX_QUEUE_CHECK = 100 # updated issues compared with the event queue, a busier window is searched instead
+EDIT_BATCH_SIZE = 50 # edited items whose edits are read in one request
+ROLLING_TOLERANCE = timedelta(hours=1) # scheduled runs do not start at exactly the same time every day
+
+# node ids never change, long running processes keep them between runs
+repo_ids: dict[str, str] = {}
+
+class DigestTarget:
+    """
+    DigestTarget is an additional digest issue that receives the subset of the fetched issues matching its filters.
+    All targets share one fetch, only the splitting and posting is done per target.
+
+    args:
+        name: str - the name of the target, shown in the title of its digest issue
+        digest_issue: str - the issue to send the digest to, created if empty
+        filters: DigestFilter - which of the fetched issues belong to this target
+    """
+    name: str
+    digest_issue: str
+    filters: DigestFilter
+
+    def __init__(self, name: str, digest_issue: str, filters: DigestFilter):
+        self.name = name
+        self.digest_issue = digest_issue
+        self.filters = filters
+
+class RollingWindow(DigestTarget):
+    """
+    RollingWindow is an additional digest issue that receives a digest over a longer window (e.g. weekly).
+    It is built from the change sets stored by previous runs, so it costs no additional requests.
+
+    args:
+        name: str - the name of the window, shown in the title of its digest issue
+        digest_issue: str - the issue to send the digest to, created if empty
+        days: int - the length of the window in days
+        last_posted: str - the UTC end of the window of the last posted digest, empty if never posted
+    """
+    days: int
+    last_posted: str
+
+    def __init__(self, name: str, digest_issue: str, days: int, last_posted: str = ""):
+        super().__init__(name, digest_issue, DigestFilter())
+        self.days = days
+        self.last_posted = last_posted
+
+    def is_due(self, now: datetime) -> bool:
+        """
+        is_due returns true if the window has passed since the last posted digest.
+
+        args:
+            now: datetime - the end of the current run
+        """
+        if not self.last_posted:
+            return True
+        return now - datetimehelper.convertToDateTime(self.last_posted) >= timedelta(days=self.days) - ROLLING_TOLERANCE
+
+    def time_range(self, now: datetime) -> tuple[datetime, datetime]:
+        """
+        time_range returns the window of the next digest, starting where the last posted digest ended.
+
+        args:
+            now: datetime - the end of the current run
+        """
+        if self.last_posted:
+            return (datetimehelper.convertToDateTime(self.last_posted), now)
+        return (now - timedelta(days=self.days), now)
 
 class DigestManager:
     """
@@ -31,87 +122,288 @@ class DigestManager:
     It is responsible for querying for issues and comments, as well as sending the digest to the target repository.
 
     args:
-        target_repo: str - the repository to query for issues
+        target_repo: str - the repository to query for issues, pull requests and discussions
         local_repo: str - the repository to send the digest to
         digest_issue: str - the issue to send the digest to
         ignored_issues: list[int] - a list of issue numbers to ignore, default to nothing
+        last_watermark: str - the UTC time at which the previous run started fetching, empty if unknown
+        overlap: int - minutes to re-read before the watermark to catch items indexed late, default to 5
+        digested: dict[str, str] - mapping of item id to the last change already reported, used for dedup
+        checkpoint: Checkpoint - where to record the pagination state so a failed run can be resumed, default to none
+        filters: DigestFilter - which issues to include, applied by the search itself, default to all issues
+        item_types: list[str] - the item types to include, any of "issue", "pull_request" and "discussion", default to issues
+        targets: list[DigestTarget] - additional digests fed from the same fetch, default to none
+        change_store: ChangeStore - where to keep the change set of every run, required by rolling windows
+        rolling_windows: list[RollingWindow] - digests over longer windows built from stored change sets, default to none
+        event_queue: EventQueue - queued issue events, used instead of searching for issues when it covers the window
+        cache: ResponseCache - on-disk cache for the node ids of the repository and the digest issues, default to no cache
+        create_issues: bool - whether to create the missing digest issues, turned off when the run does not post, default to true
+        source: str - "search" to search for the items, "repository" to list the issues of the repository instead,
+            or "auto" to list the issues unless the filters need search qualifiers, default to search
+        edit_history: int - the number of edits to read for the bodies edited in the window, so that only the changed
+            lines are shown, default to 0 which shows the whole body
+        export: ChangeExport - where to export the changes of the run for other tools, default to no export
     """
-    cursor:str = None
+    cursors: dict[str, str]
+    completed: dict[str, bool]
     target_repo: str
     local_repo: str
     timestamp: datetime
     digest_issue: str
-    complete: bool
     ignored_issues: list[int]
     last_update_time: datetime
-    query = MainQuery()
-
-    def __init__(self, target_repo:str, local_repo:str, digest_issue:str, ignored_issues=[]) -> None:
+    window_start: datetime
+    fetch_start: datetime
+    overlap: timedelta
+    digested: dict[str, str]
+    checkpoint: Checkpoint
+    filters: DigestFilter
+    item_types: list[str]
+    targets: list[DigestTarget]
+    change_store: ChangeStore
+    rolling_windows: list[RollingWindow]
+    event_queue: EventQueue
+    cache: ResponseCache
+    query: MainQuery
+    search_window: tuple[datetime, datetime | None] | None
+    edit_history: int
+    activity: dict[str, int] | None
+    excluded: dict[str, GitIssue]
+    export: ChangeExport
+    create_issues: bool
+    digest_states: dict[str, dict]
+    pending_posts: dict[str, str]
+
+    def __init__(self, target_repo:str, local_repo:str, digest_issue:str, ignored_issues=[],
+                 last_watermark:str = "", overlap:int = 5, digested:dict[str, str] = None,
+                 checkpoint:Checkpoint = None, filters:DigestFilter = None, item_types:list[str] = ["issue"],
+                 targets:list[DigestTarget] = None, change_store:ChangeStore = None,
+                 rolling_windows:list[RollingWindow] = None, event_queue:EventQueue = None,
+                 cache:ResponseCache = None, create_issues:bool = True, source:str = "search", edit_history:int = 0,
+                 export:ChangeExport = None) -> None:
         self.target_repo = target_repo
         self.local_repo = local_repo
         self.digest_issue = digest_issue
-        self.complete = False
+        self.item_types = item_types
+        self.filters = filters or DigestFilter()
+        if source == "auto":
+            # the listing is not capped at 1000 results and has no index lag, but filters can only be searched for
+            source = "search" if self.filters.to_search_qualifiers() else "repository"
+        self.query = MainQuery(item_types, source)
+        self.cursors = {item_type: None for item_type in item_types}
+        self.completed = {item_type: False for item_type in item_types}
         self.ignored_issues = ignored_issues
-        self.create_issue()
-        self.update_last_change_date()
+        self.overlap = timedelta(minutes=overlap)
+        self.digested = digested or {}
+        self.checkpoint = checkpoint
+        self.targets = targets or []
+        self.change_store = change_store
+        self.rolling_windows = rolling_windows or []
+        self.event_queue = event_queue
+        self.cache = cache
+        self.fetch_start = datetimehelper.get_now()
+        self.search_window = None
+        self.edit_history = edit_history
+        self.activity = None
+        self.excluded = {}
+        self.export = export
+        self.create_issues = create_issues
+        self.digest_states = {}
+        self.pending_posts = {}
+        if create_issues:
+            self.create_issue()
+        self.update_last_change_date(last_watermark)
+
+    @property
+    def complete(self) -> bool:
+        """
+        complete returns true if the pagination of every item type of the main query is complete.
+        """
+        return all(self.completed.values())
 
     def run_query(self, additional_queries: list[str] = []) -> dict:
         """
-        run_query runs the main query to query for issues if the pagination of the main query is not complete.
+        run_query runs the main query to query for items if the pagination of the main query is not complete.
         It will also run additional queries if provided. The additional queries are expected to be partial queries.
 
         args:
             additional_queries: list[str] - a list of additional queries to run
         """
+        queries = list(additional_queries)
         if not self.complete:
-            additional_queries.append(
+            queries.append(
                 self.query.partial_query(
                     self.target_repo,
                     datetimehelper.format_to_utc(self.last_update_time),
-                    self.cursor)
+                    self.cursors,
+                    self.completed,
+                    self.filters.to_search_qualifiers(),
+                    self.query_window)
             )
-        res = run_queries(additional_queries)
+        res = run_queries(queries)
         return res
     
     def get_result(self) -> list[GitIssue]:
         """
-        get_result is a runs the main query to query for issues as well as fetch comments for each issue
-        until all comments of each issue is fetched.
+        get_result is a runs the main query to query for issues, pull requests and discussions
+        as well as fetch comments for each of them until all comments of each item is fetched.
 
         returns:
             list[GitIssue] - a list of GitIssue objects
         """ 
+        self.fetch_start = datetimehelper.get_now()
+        self.excluded = {}
         ret: dict[str, GitIssue] = {}
         extra = []
+        if self.export:
+            self.export.begin(self.time_range)
+        if self.checkpoint:
+            self.resume(ret)
+        if self.event_queue and self.event_queue.active and self.completed.get("issue") == False:
+            self.read_event_queue(ret)
+        # the counts and the digest issues are cheap, so they are read along with the first page
+        bootstrap = self.digest_state_queries(self.digest_issues) if self.create_issues else []
+        if self.query.activity_counters:
+            bootstrap.append(self.query.activity_query(
+                self.target_repo, datetimehelper.format_to_utc(self.window_start), self.filters.to_search_qualifiers()))
+        counts = None
         while not self.complete or (extra := [ret[key].draft_gql_query() for key in ret if ret[key].has_more_data]):
-            res = self.run_query(extra)
-            if not self.complete:
-                main_res = self.query.read_result(res)
-                self.update_cursor(main_res["pageInfo"])
-                self.convert_data(main_res["nodes"], ret)
+            res = self.run_query(extra + bootstrap)
+            if bootstrap:
+                counts = self.read_bootstrap(res)
+                bootstrap = []
+            for item_type, main_res in self.query.read_result(res, self.query_window).items():
+                self.update_cursor(item_type, main_res["pageInfo"])
+                self.convert_data(item_type, main_res["nodes"], ret)
+                if self.checkpoint:
+                    self.checkpoint.add_page(item_type, self.cursors[item_type], self.completed[item_type], main_res["nodes"])
             if extra:
                 for key in ret:
                     if ret[key].has_more_data:
-                        ret[key].read_paginated_comments(ret[key].comments_query.read_result(res))
-        
-        return sorted([ret[key] for key in ret], key=lambda issue: issue.number)
+                        pages = ret[key].read_paginated_result(res)
+                        if self.checkpoint and pages:
+                            self.checkpoint.add_pages(key, pages)
+            if self.export:
+                # stream out the issues whose comments and events are all read
+                for issue in ret.values():
+                    if not issue.has_more_data and issue.total_changes > 0:
+                        self.export.write(self.target_repo, issue)
+        if bootstrap:
+            # the event queue held every item, so no page was read
+            counts = self.read_bootstrap(run_queries(bootstrap))
+        if counts:
+            self.activity = self.exclude_activity(counts)
+
+        return sorted([ret[key] for key in ret], key=lambda issue: (self.item_types.index(issue.item_type), issue.number))
+
+    def read_bootstrap(self, res: dict) -> dict[str, int] | None:
+        """
+        read_bootstrap reads the digest issues and the activity counts read along with the first page.
 
-    def update_cursor(self, graphqlResult: dict):
+        args:
+            res: dict - the result of the queries
+
+        returns:
+            dict[str, int] | None - the number of items opened and closed in the window, None if they were not counted
+        """
+        if self.create_issues:
+            self.read_digest_states(self.digest_issues, res)
+        return self.query.read_activity(res) if self.query.activity_counters else None
+
+    def exclude_activity(self, counts: dict[str, int]) -> dict[str, int]:
+        """
+        exclude_activity removes the digest issues and the ignored issues from the activity counts.
+        Search has no qualifier to leave out an issue number, but the items opened or closed in the window were
+        also updated in it, so the excluded ones were read by the main query and are subtracted here.
+
+        args:
+            counts: dict[str, int] - the number of items opened and closed in the window as counted by the search
+        """
+        opened = sum(1 for issue in self.excluded.values() if issue.created_at >= self.window_start)
+        closed = sum(1 for issue in self.excluded.values() if issue.closed_at and issue.closed_at >= self.window_start)
+        return {"opened": max(counts["opened"] - opened, 0), "closed": max(counts["closed"] - closed, 0)}
+
+    def resume(self, ret: dict[str, GitIssue]):
+        """
+        resume restores the pagination state and the already fetched issues from the checkpoint
+        if it was recorded for the same window, otherwise a new checkpoint is started.
+
+        args:
+            ret: dict[str, GitIssue] - the dictionary to store the GitIssue objects, this will be mutated in place
+        """
+        window_start = datetimehelper.format_to_utc(self.last_update_time)
+        records = self.checkpoint.load(window_start)
+        if not records:
+            self.checkpoint.begin(window_start, self.watermark)
+            return
+
+        print(f"Resuming from checkpoint with {len(records) - 1} recorded requests.")
+        self.fetch_start = datetimehelper.convertToDateTime(records[0]["end"])
+        for record in records[1:]:
+            item_type = record.get("item_type", "issue")
+            if record["type"] == "page" and item_type in self.completed:
+                self.cursors[item_type] = record["cursor"]
+                self.completed[item_type] = record["complete"]
+                self.convert_data(item_type, record["nodes"], ret)
+            elif record["type"] == "pages" and record["issue"] in ret:
+                ret[record["issue"]].read_pages(record["pages"])
+            elif record["type"] == "posts":
+                self.pending_posts.update(record["posts"])
+
+    def read_event_queue(self, ret: dict[str, GitIssue]):
+        """
+        read_event_queue builds the issues from the event queue if it holds every event of the window,
+        the issue search is then skipped. Otherwise the search runs as usual to fill the gap.
+
+        An ingest run that was cancelled or could not push its event leaves a gap that the coverage does not show,
+        so the issues updated in the window are searched for and compared with the queued issues. An issue that is
+        missing from the queue, or was updated after its last queued event, means events were lost.
+        Events lost before the last queued event of an issue are not detected.
+
+        args:
+            ret: dict[str, GitIssue] - the dictionary to store the GitIssue objects, this will be mutated in place
         """
-        update_cursor updates the cursor and complete flag based on the pageInfo of the main query.
+        if not self.event_queue.covers(self.last_update_time):
+            print("Event queue does not cover the digest window, searching for issues instead.")
+            return
+
+        raw = self.event_queue.build(self.time_range).get("issue", [])
+        q = UpdatedIssueNumbers("updated_issue_numbers")
+        updated = q.get_updates(q.run(self.target_repo, datetimehelper.format_to_utc(self.last_update_time), MAX_QUEUE_CHECK))
+        if updated is None:
+            print("Too many issues were updated to check the event queue, searching for issues instead.")
+            return
+        queued = {issue["number"]: issue.get("updatedAt") or "" for issue in raw}
+        missing = {number for number, updated_at in updated.items()
+                   if number not in queued or queued[number] < updated_at} - set(self.ignored_issues)
+        if missing:
+            print(f"Event queue is missing the events of issues {sorted(missing)}, searching for issues instead.")
+            return
+
+        self.completed["issue"] = True
+        issues: dict[str, GitIssue] = {}
+        self.convert_data("issue", raw, issues)
+        # the search qualifiers were not applied to the queued issues
+        ret.update((key, issue) for key, issue in issues.items() if self.filters.matches(issue))
+
+    def update_cursor(self, item_type: str, graphqlResult: dict):
+        """
+        update_cursor updates the cursor and complete flag of an item type based on the pageInfo of the main query.
 
         args:
+            item_type: str - the item type of the result
             graphqlResult: dict - the result of the main query
         """
-        self.cursor = graphqlResult["endCursor"]
-        self.complete = not graphqlResult["hasNextPage"]
+        self.cursors[item_type] = graphqlResult["endCursor"]
+        self.completed[item_type] = not graphqlResult["hasNextPage"]
     
-    def convert_data(self, graphqlResult: dict, ret: dict[str, GitIssue]):
+    def convert_data(self, item_type: str, graphqlResult: dict, ret: dict[str, GitIssue]):
         """
-        convert_data converts the graphql result into GitIssue objects and stores them in the ret dictionary
-        with the issue id as the key.
+        convert_data converts the graphql result into GitIssue objects (or the subclass of the item type)
+        and stores them in the ret dictionary with the item id as the key.
 
         args:
+            item_type: str - the item type of the result
             graphqlResult: dict - the result of the main query
             ret: dict[str, GitIssue] - the dictionary to store the GitIssue objects, this will be mutated in place
         """
@@ -119,155 +411,377 @@ class DigestManager:
             if not raw_issue: 
                 continue
             
-            issue = GitIssue(raw_issue, (self.last_update_time, datetimehelper.get_now()))
-            if issue.number in self.ignored_issues or issue.id == self.digest_issue:
-                # ignore the target issue and the issues in the ignore list
+            issue = item_classes[item_type](raw_issue, self.time_range, self.digested)
+            if (item_type != "discussion" and issue.number in self.ignored_issues) or issue.id in self.digest_issues:
+                # ignore the target issue and the issues in the ignore list, the ones the activity counted are removed from it
+                if item_type in ("issue", "pull_request") and self.filters.matches(issue):
+                    self.excluded[issue.id] = issue
+                continue
+            if not self.query.sources[item_type].applies_qualifiers and not self.filters.matches(issue):
                 continue
 
             ret[issue.id] = issue
 
-    def get_default_size(self, issues: list[GitIssue]) -> int:
+    @property
+    def query_window(self) -> tuple[str, str | None] | None:
+        """
+        query_window returns the UTC search window passed to the main query, or None to search from the start of the window.
+        """
+        if not self.search_window:
+            return None
+        start, end = self.search_window
+        return (datetimehelper.format_to_utc(start), datetimehelper.format_to_utc(end) if end else None)
+
+    @property
+    def time_range(self) -> tuple[datetime, datetime]:
+        """
+        time_range returns the window of the current run.
+        """
+        return (self.last_update_time, self.fetch_start)
+
+    def read_content_edits(self, issues: list[GitIssue]):
+        """
+        read_content_edits reads the body before the window of the items that were edited, but not created, in the window.
+        The edits of up to EDIT_BATCH_SIZE items are read per request.
+
+        args:
+            issues: list[GitIssue] - the issues to read the edits for, the bodies before the window are set in place
+        """
+        if not self.edit_history:
+            return
+        edited = [
+            item for issue in issues for item in [issue] + issue.comments
+            if item.get_status_str(self.time_range) == "modified" and item.within_time_range(self.time_range)
+        ]
+        for start in range(0, len(edited), EDIT_BATCH_SIZE):
+            batch = edited[start:start + EDIT_BATCH_SIZE]
+            queries = [ReadContentEdits(f"read_edits_{i}") for i in range(len(batch))]
+            res = run_queries([q.partial_query(item.id, self.edit_history) for q, item in zip(queries, batch)])
+            for q, item in zip(queries, batch):
+                item.previous_body = q.get_body_before(res, self.time_range[0])
+
+    def get_default_size(self, issues: list[GitIssue], time_range: tuple[datetime, datetime], stats: str = "") -> int:
         """
         get_default_size gets the body of the issue and returns the default size without any body
 
         args:
             issue: GitIssue - the issue to get the body from
+            time_range: tuple[datetime, datetime] - the window shown in the header
+            stats: str - the activity stats shown in the header
         """
         issues = [issue for issue in issues]
         total_changes = sum([issue.total_changes for issue in issues])
         return len(digest_header.format(
-                    time_start=datetimehelper.format_local(self.last_update_time),
-                    time_end=datetimehelper.format_local(datetimehelper.get_now()),
+                    time_start=datetimehelper.format_local(time_range[0]),
+                    time_end=datetimehelper.format_local(time_range[1]),
                     all_changes=total_changes,
                     issues_changed=len(issues),
+                    stats=stats,
                     body='',
                     additional_issues='',
                     tz=datetimehelper.localtz.zone
                 ))
-    
-    def is_locked(self):
+
+    def draft_stats(self, issues: list[GitIssue], activity: dict[str, int] = None) -> str:
         """
-        is_locked checks if the digest issue is locked.
+        draft_stats renders the activity stats of the digest from the fetched issues, no extra data is read.
+
+        args:
+            issues: list[GitIssue] - the issues in the digest
+            activity: dict[str, int] - the number of issues opened and closed in the window, default to unknown
         """
-        q = ReadIssueLock("read_issue_lock")
-        res = q.run(issue_id=self.digest_issue)
-        return q.is_locked(res)
+        if not issues:
+            return ""
+        counts = [f"{activity['opened']} opened", f"{activity['closed']} closed"] if activity else []
+        counts.append(f"{sum(len(issue.comments) for issue in issues)} comments")
 
-    def lock_issue(self):
+        authors = Counter()
+        for issue in issues:
+            if issue.contains_changes:
+                authors[issue.last_change_author] += 1
+            authors.update(comment.last_change_author for comment in issue.comments)
+            authors.update(event.actor for event in issue.events)
+
+        top_issues = heapq.nlargest(TOP_STATS_SIZE, issues, key=lambda issue: issue.total_changes)
+        return stats_template.format(
+            activity=", ".join(counts),
+            top_issues=", ".join(f"{issue.simple_link} ({issue.total_changes})" for issue in top_issues),
+            top_authors=", ".join(f"`{author}` ({count})" for author, count in authors.most_common(TOP_STATS_SIZE))
+        )
+    
+    @property
+    def digest_issues(self) -> list[str]:
         """
-        lock_issue locks the digest issue.
+        digest_issues returns the digest issue followed by the digest issues of the additional targets and rolling windows.
         """
-        q = LockIssue("lock_issue")
-        q.run(issue_id=self.digest_issue)
+        return [self.digest_issue] + [target.digest_issue for target in self.targets + self.rolling_windows]
 
-    def unlock_issue(self):
+    def digest_state_queries(self, issue_ids: list[str]) -> list[str]:
         """
-        unlock_issue unlocks the digest issue.
+        digest_state_queries returns the partial queries reading the lock state, the body and the last comments
+        of the given digest issues, see read_digest_states.
+
+        args:
+            issue_ids: list[str] - the digest issues to read, empty ids are skipped
         """
-        q = UnlockIssue("unlock_issue")
-        q.run(issue_id=self.digest_issue)
+        return [ReadDigestIssue(f"digest_issue_{i}").partial_query(issue_id, RECENT_COMMENTS)
+                for i, issue_id in enumerate(issue_ids) if issue_id]
 
-    @staticmethod
-    def _retain_lock(func: callable):
+    def read_digest_states(self, issue_ids: list[str], res: dict):
         """
-        decorator that retains the lock state of the digest issue.
+        read_digest_states stores the state of the digest issues read by digest_state_queries.
+
+        args:
+            issue_ids: list[str] - the digest issues that were read, in the same order as the queries
+            res: dict - the result of the queries
         """
-        def lock_wrapper(self, *args, **kwargs):
-            locked = self.is_locked()
-            if locked:
-                self.unlock_issue()
-            try:
-                func(self, *args, **kwargs)
-            finally:
-                if locked:
-                    self.lock_issue()
-        return lock_wrapper
-    
-    @_retain_lock
-    def send_data(self, issues: list[GitIssue]):
+        for i, issue_id in enumerate(issue_ids):
+            if not issue_id:
+                continue
+            q = ReadDigestIssue(f"digest_issue_{i}")
+            self.digest_states[issue_id] = {
+                "locked": q.is_locked(res),
+                "body": q.get_body(res),
+                "hashes": {h for body in q.get_comment_bodies(res) for h in digest_hash_regex.findall(body)}
+            }
+
+    def draft_digest(self, issues: list[GitIssue], time_range: tuple[datetime, datetime], activity: dict[str, int] = None) -> str:
         """
-        send_data sends mutation to update the digest issue with the new data.
-        It takes in a list of GitIssue objects and only sends the data if there are changes.
+        draft_digest renders the digest comment for the given issues. If they do not all fit in a comment,
+        the most active issues are shortened to fit, and the issues that do not fit are listed as links at the end.
 
         args:
             issues: list[GitIssue] - a list of GitIssue objects
+            time_range: tuple[datetime, datetime] - the window shown in the header
+            activity: dict[str, int] - the number of issues opened and closed in the window, default to unknown
+
+        returns:
+            str - the body of the digest comment
         """
         total_changes = sum([issue.total_changes for issue in issues])
-        if total_changes == 0:
-            # no changes were detected
-            return
-        
-        content: list[str] = []
-        shortened_content: list[str] = []
-        curr_len = 0
-        availabe_len = MAX_BODY_SIZE - self.get_default_size(issues)
-
-        length_exceeded = False
+        stats = self.draft_stats(issues, activity)
+        availabe_len = MAX_BODY_SIZE - self.get_default_size(issues, time_range, stats) - len(additional_issues_template.format(links=""))
+        content, shortened_content, hidden = pack(issues, render_issues(issues), availabe_len)
+        if hidden:
+            shortened_content.append(hidden_template.format(hidden=hidden))
 
-        for issue in issues:
-            if (length_exceeded):
-                shortened_content.append(issue.simple_link)
-                continue
-            content.append(issue.to_markdown())
-            curr_len += len(content[-1])
-
-            if curr_len > availabe_len:
-                content.pop()
-                shortened_content.append(issue.simple_link)
-                length_exceeded = True
-        
         additional_issues_str = ""
         if shortened_content:
             additional_issues_str = additional_issues_template.format(links = ' '.join(shortened_content))
-            
-
 
-        r1 = UpdateIssue("update_issue").partial_query(self.digest_issue, digest_content)
-        r2 = AddComment("new_digest").partial_query(self.digest_issue, digest_header.format(
-                    time_start=datetimehelper.format_local(self.last_update_time),
-                    time_end=datetimehelper.format_local(datetimehelper.get_now()),
+        return digest_header.format(
+                    time_start=datetimehelper.format_local(time_range[0]),
+                    time_end=datetimehelper.format_local(time_range[1]),
                     all_changes=total_changes,
                     issues_changed=len(issues),
+                    stats=stats,
                     body=''.join(content),
                     additional_issues=additional_issues_str,
                     tz=datetimehelper.localtz.zone
-                ))
-        
-        run_mutations([r1, r2])
+                )
+
+    def send_data(self, issues: list[GitIssue]):
+        """
+        send_data sends mutation to update the digest issue with the new data.
+        It takes in a list of GitIssue objects and only sends the data if there are changes.
+
+        The issues are also split across the additional targets by their filters, and the rolling windows
+        that are due get a digest built from the stored change sets. The digests of all targets are
+        posted in a single batch of mutations, see post_digests.
+
+        args:
+            issues: list[GitIssue] - a list of GitIssue objects
+        """
+        # the opened and closed counts are only known for the main digest, the other digests cover other issues or windows
+        groups = [(self.digest_issue, issues, self.time_range, self.activity)] + [
+            (target.digest_issue, [issue for issue in issues if target.filters.matches(issue)], self.time_range, None)
+            for target in self.targets
+        ]
+        due_windows = self.due_windows()
+        for window in due_windows:
+            time_range = window.time_range(self.fetch_start)
+            groups.append((window.digest_issue, self.change_store.merge(time_range), time_range, None))
+
+        posts = [
+            (digest_issue, self.draft_digest(group, time_range, activity))
+            for digest_issue, group, time_range, activity in groups
+            # no changes were detected for the digests without issues
+            if sum([issue.total_changes for issue in group]) > 0
+        ]
+        if posts:
+            self.post_digests(posts)
+        for window in due_windows:
+            window.last_posted = self.watermark
+
+    def post_digests(self, posts: list[tuple[str, str]]):
+        """
+        post_digests posts the digest comments in a single request. The locked digest issues are unlocked
+        and locked again within the same request, and the body of a digest issue is only rewritten if it changed.
+
+        Every comment is marked with the hash of its content, and the hashes are recorded in the checkpoint
+        before posting. A digest whose hash, or the hash recorded for its digest issue by an earlier attempt
+        of the same run, is among the last comments of the digest issue was already posted and is skipped,
+        so a run retried after losing the response of GitHub does not post the digest twice.
+
+        args:
+            posts: list[tuple[str, str]] - the digest issue and the body of each digest comment
+        """
+        unread = [digest_issue for digest_issue, _ in posts if digest_issue not in self.digest_states]
+        if unread:
+            self.read_digest_states(unread, run_queries(self.digest_state_queries(unread)))
+
+        pending: dict[str, str] = {}
+        comments = []
+        for i, (digest_issue, body) in enumerate(posts):
+            content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+            posted = self.digest_states[digest_issue]["hashes"]
+            if content_hash in posted or self.pending_posts.get(digest_issue) in posted:
+                print(f"Digest for {digest_issue} was already posted, skipping it.")
+                continue
+            pending[digest_issue] = content_hash
+            comments.append(AddComment(f"new_digest_{i}").partial_query(digest_issue, body + digest_hash_template.format(hash=content_hash)))
+        if not comments:
+            return
+
+        locked = [digest_issue for digest_issue in pending if self.digest_states[digest_issue]["locked"]]
+        # the mutations of a request are run in order, so the digest issues are unlocked before commenting
+        mutations = [UnlockIssue(f"unlock_issue_{i}").partial_query(digest_issue) for i, digest_issue in enumerate(locked)]
+        mutations += [
+            UpdateIssue(f"update_issue_{i}").partial_query(digest_issue, digest_content)
+            for i, digest_issue in enumerate(pending) if self.digest_states[digest_issue]["body"] != digest_content
+        ]
+        mutations += comments
+        mutations += [LockIssue(f"lock_issue_{i}").partial_query(digest_issue) for i, digest_issue in enumerate(locked)]
+
+        if self.checkpoint:
+            self.checkpoint.add_posts(pending)
+        run_mutations(mutations)
+
+    def due_windows(self) -> list[RollingWindow]:
+        """
+        due_windows returns the rolling windows that should be posted in this run.
+        """
+        if not self.change_store:
+            return []
+        return [window for window in self.rolling_windows if window.is_due(self.fetch_start)]
+
+    def record_changes(self, issues: list[GitIssue]):
+        """
+        record_changes stores the change set of this run for the rolling windows, and deletes the
+        change sets that are older than the longest window.
+
+        args:
+            issues: list[GitIssue] - the changed issues of this run
+        """
+        if not self.change_store or not self.rolling_windows:
+            return
+        if issues:
+            self.change_store.record(self.time_range, issues)
+        longest = max(window.days for window in self.rolling_windows)
+        self.change_store.evict(self.fetch_start - timedelta(days=longest) - ROLLING_TOLERANCE)
 
     def find_repo_id(self) -> str:
         """
         find_repo_id finds the repo id of the target repo.
         """
+        if self.local_repo in repo_ids:
+            return repo_ids[self.local_repo]
+        key = f"repo_id:{self.local_repo}"
+        cached = self.cache.get(key) if self.cache else None
+        if cached:
+            repo_ids[self.local_repo] = cached["id"]
+            return cached["id"]
         owner, repo = self.local_repo.split("/")
         q = FindRepoId("find_repo_id")
         res = q.run(owner=owner, repo=repo)
 
-        return q.get_repo_id(res)
+        repo_ids[self.local_repo] = q.get_repo_id(res)
+        if self.cache:
+            self.cache.put(key, {"id": repo_ids[self.local_repo]})
+        return repo_ids[self.local_repo]
     
-    def update_last_change_date(self):
+    @property
+    def watermark(self) -> str:
+        """
+        watermark returns the UTC time at which the current run started fetching.
+        Everything changed before this point is covered by this run, so the next run can start from here.
         """
-        update_last_change_date updates the last update time of the digest issue based on the last comment date.
+        return datetimehelper.format_to_utc(self.fetch_start)
 
+    def mark_digested(self, issues: list[GitIssue]):
+        """
+        mark_digested records the issues and comments reported in this run so that the overlap window
+        of the next run does not report them again. Entries that fall before the next window are dropped.
+
+        args:
+            issues: list[GitIssue] - the issues that were sent in the digest
+        """
+        next_start = self.fetch_start - self.overlap
+        digested = {
+            key: value for key, value in self.digested.items()
+            if datetimehelper.convertToDateTime(value) >= next_start
+        }
+        for issue in issues:
+            changed = issue.comments + issue.events + ([issue] if issue.contains_changes else [])
+            for item in changed:
+                if item.last_change_date >= next_start:
+                    digested[item.id] = datetimehelper.format_to_utc(item.last_change_date)
+        self.digested = digested
+
+    def update_last_change_date(self, last_watermark: str = "", now: datetime = None):
+        """
+        update_last_change_date updates the start of the digest window.
+
+        The window starts at the stored watermark minus the overlap, the activity is counted from the watermark itself. If no watermark is stored
+        (first run after an upgrade), it falls back to the date of the last comment of the digest issue.
         By default, if there are no comments in the digest issue, the last update time will
-        be 3 days prior to the current time.
+        be 10 days prior to the current time.
+
+        args:
+            last_watermark: str - the UTC time at which the previous run started fetching
+            now: datetime - the time the default window is counted back from, default to the current time
         """
-        q = ReadLastCommentDate("read_last_comment")
-        res = q.run(issue_id=self.digest_issue)
-        self.last_update_time = q.get_last_comment_date(res) or datetimehelper.get_n_day_prior(10)
+        if last_watermark:
+            self.window_start = datetimehelper.convertToDateTime(last_watermark)
+            self.last_update_time = self.window_start - self.overlap
+            return
+        if not self.digest_issue:
+            self.last_update_time = (now or datetimehelper.get_now()) - timedelta(days=10)
+        else:
+            q = ReadLastCommentDate("read_last_comment")
+            res = q.run(issue_id=self.digest_issue)
+            self.last_update_time = q.get_last_comment_date(res) or (now or datetimehelper.get_now()) - timedelta(days=10)
+        self.window_start = self.last_update_time
 
     def create_issue(self):
         """
-        create_issue creates the digest issue if it does not exist and update the target_issue field.
-        If the target repo is the same as the local repo, then the issue number is added to the ignore list.
+        create_issue creates the digest issue and the digest issues of the targets if they do not exist
+        and update the digest_issue fields.
+        If the target repo is the same as the local repo, then the issue numbers are added to the ignore list.
+        The created issues are cached right away, so a run that fails before its state is saved does not
+        create them again.
         """
-        if self.digest_issue:
-            # issue already exist
+        missing = ([self] if not self.digest_issue else []) + [
+            target for target in self.targets + self.rolling_windows if not target.digest_issue
+        ]
+        if not missing:
+            # issues already exist
             return
         repo_id = self.find_repo_id()
-        q = CreateIssue("create_issue")
-        res = q.run(repo_id=repo_id, title=f"[{self.target_repo}] Issues Digest", body=digest_content)
-
-        self.digest_issue = q.get_issue_id(res)
-        if self.local_repo == self.target_repo:
-            self.ignored_issues.append(q.get_issue_number(res))
+        for target in missing:
+            title = f"[{self.target_repo}] Issues Digest"
+            if target is not self:
+                title += f" ({target.name})"
+            key = f"digest_issue:{self.local_repo}:{title}"
+            created = self.cache.get(key) if self.cache else None
+            if not created:
+                q = CreateIssue("create_issue")
+                res = q.run(repo_id=repo_id, title=title, body=digest_content)
+                created = {"id": q.get_issue_id(res), "number": q.get_issue_number(res)}
+                if self.cache:
+                    self.cache.put(key, created)
+                    self.cache.save()
+
+            target.digest_issue = created["id"]
+            if self.local_repo == self.target_repo:
+                self.ignored_issues.append(created["number"])
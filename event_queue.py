@@ -0,0 +1,243 @@
+import json
+import os
+import sys
+from datetime import datetime
+import datetimehelper
+
+ISSUE_EVENT_TYPES = {
+    "closed": "ClosedEvent",
+    "reopened": "ReopenedEvent",
+    "labeled": "LabeledEvent",
+    "unlabeled": "UnlabeledEvent",
+    "assigned": "AssignedEvent",
+    "unassigned": "UnassignedEvent",
+}
+
+def login_of(user: dict | None) -> dict | None:
+    return {"login": user["login"]} if user else None
+
+def convert_issue(issue: dict) -> dict:
+    """
+    convert_issue converts the issue of a webhook payload into the shape of the GraphQL result of the main query.
+
+    args:
+        issue: dict - the issue of the payload
+    """
+    return {
+        "id": issue["node_id"],
+        "item_type": "pull_request" if "pull_request" in issue else "issue",
+        "url": issue["html_url"],
+        "number": issue["number"],
+        "title": issue["title"],
+        "body": issue["body"] or "",
+        "createdAt": issue["created_at"],
+        "updatedAt": issue["updated_at"],
+        "author": login_of(issue["user"]),
+        "lastEditedAt": None,
+        "editor": None,
+        "closed": issue["state"] == "closed",
+        "closedAt": issue.get("closed_at"),
+        "labels": {"nodes": [{"name": label["name"]} for label in issue.get("labels", [])]},
+        "milestone": {"title": issue["milestone"]["title"]} if issue.get("milestone") else None,
+    }
+
+def convert_comment(comment: dict) -> dict:
+    """
+    convert_comment converts the comment of a webhook payload into the shape of the GraphQL result of the main query.
+
+    args:
+        comment: dict - the comment of the payload
+    """
+    return {
+        "id": comment["node_id"],
+        "url": comment["html_url"],
+        "body": comment["body"],
+        "createdAt": comment["created_at"],
+        "author": login_of(comment["user"]),
+        "lastEditedAt": None,
+        "editor": None,
+    }
+
+def convert_event(action: str, payload: dict) -> dict:
+    """
+    convert_event converts an issue event payload into the shape of a timeline event of the main query.
+
+    args:
+        action: str - the action of the payload
+        payload: dict - the payload
+    """
+    issue = payload["issue"]
+    event = {
+        "__typename": ISSUE_EVENT_TYPES[action],
+        "id": f"{issue['node_id']}_{action}_{issue['updated_at']}",
+        "createdAt": issue["updated_at"],
+        "actor": login_of(payload.get("sender")),
+    }
+    if action in ("labeled", "unlabeled"):
+        event["label"] = {"name": payload["label"]["name"]}
+    if action in ("assigned", "unassigned"):
+        event["assignee"] = login_of(payload.get("assignee")) or {}
+    return event
+
+class EventQueue:
+    """
+    EventQueue is a local queue of the issues and issue_comment events that triggered the action.
+
+    The queue records the time from which it holds every event (its coverage). When the coverage
+    reaches back to the start of a digest window, the issues can be built from the queue alone,
+    without searching or paginating comments.
+
+    args:
+        path: str - the path of the queue file
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> tuple[str, list[dict]]:
+        """
+        read reads the queue.
+
+        returns:
+            tuple[str, list[dict]] - the UTC start of the coverage (empty if there is no queue) and the queued records
+        """
+        if not os.path.exists(self.path):
+            return "", []
+        records = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.decoder.JSONDecodeError:
+                    # partially written last line
+                    break
+        if not records or records[0].get("type") != "coverage":
+            return "", []
+        return records[0]["since"], records[1:]
+
+    def _replace(self, since: str, records: list[dict]):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            for record in [{"type": "coverage", "since": since}] + records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path)
+
+    def ingest(self, event_name: str, payload: dict):
+        """
+        ingest adds the payload of an issues or issue_comment event to the queue.
+        Other events are ignored.
+
+        args:
+            event_name: str - the name of the event that triggered the action
+            payload: dict - the payload of the event
+        """
+        if event_name not in ("issues", "issue_comment"):
+            print(f"Event {event_name} cannot be ingested, ignoring it.", file=sys.stderr)
+            return
+
+        action = payload["action"]
+        sender = login_of(payload.get("sender"))
+        issue = convert_issue(payload["issue"])
+        record = {"type": "event", "time": payload["issue"]["updated_at"], "issue": issue}
+
+        if event_name == "issues":
+            if action == "deleted":
+                record["deleted"] = True
+            elif action == "edited":
+                issue["lastEditedAt"] = payload["issue"]["updated_at"]
+                issue["editor"] = sender
+            elif action in ISSUE_EVENT_TYPES:
+                record["event"] = convert_event(action, payload)
+        else:
+            comment = convert_comment(payload["comment"])
+            if action == "edited":
+                comment["lastEditedAt"] = payload["comment"]["updated_at"]
+                comment["editor"] = sender
+            record["time"] = payload["comment"]["updated_at"]
+            record["comment"] = comment
+            record["deleted"] = action == "deleted"
+
+        if not os.path.exists(self.path):
+            # the queue holds every event from now on
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._replace(datetimehelper.format_to_utc(datetimehelper.get_now()), [])
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    @property
+    def active(self) -> bool:
+        """
+        active returns true if events have been queued, i.e. the action is also triggered in ingest mode.
+        """
+        return os.path.exists(self.path)
+
+    def covers(self, start: datetime) -> bool:
+        """
+        covers returns true if the queue holds every event since the given time.
+
+        args:
+            start: datetime - the start of the digest window
+        """
+        since, _ = self.read()
+        return bool(since) and datetimehelper.convertToDateTime(since) <= start
+
+    def build(self, time_range: tuple[datetime, datetime]) -> dict[str, list[dict]]:
+        """
+        build merges the queued events within the time range into issues in the shape of the
+        GraphQL result of the main query, grouped by item type.
+
+        args:
+            time_range: tuple[datetime, datetime] - the time range to build the issues for
+
+        returns:
+            dict[str, list[dict]] - the raw issues by item type
+        """
+        _, records = self.read()
+        merged: dict[str, dict] = {}
+        for record in records:
+            if not time_range[0] <= datetimehelper.convertToDateTime(record["time"]) <= time_range[1]:
+                continue
+            issue = record["issue"]
+            entry = merged.setdefault(issue["id"], {"issue": issue, "comments": {}, "events": {}})
+            previous = entry["issue"]
+            if previous["lastEditedAt"] and not issue["lastEditedAt"]:
+                # an event without an edit must not hide an earlier edit
+                issue = {**issue, "lastEditedAt": previous["lastEditedAt"], "editor": previous["editor"]}
+            if (previous.get("updatedAt") or "") > (issue.get("updatedAt") or ""):
+                # events can be pushed out of order, the digest check needs the last update that was queued
+                issue = {**issue, "updatedAt": previous["updatedAt"]}
+            entry["issue"] = issue
+            if "comment" not in record and record.get("deleted"):
+                entry["deleted"] = True
+            if "comment" in record:
+                if record["deleted"]:
+                    entry["comments"].pop(record["comment"]["id"], None)
+                else:
+                    entry["comments"][record["comment"]["id"]] = record["comment"]
+            if "event" in record:
+                entry["events"][record["event"]["id"]] = record["event"]
+
+        ret: dict[str, list[dict]] = {}
+        for entry in merged.values():
+            if entry.get("deleted"):
+                continue
+            raw = dict(entry["issue"])
+            raw["comments"] = {"pageInfo": {"endCursor": None, "hasNextPage": False}, "nodes": list(entry["comments"].values())}
+            raw["timelineItems"] = {"pageInfo": {"endCursor": None, "hasNextPage": False}, "nodes": list(entry["events"].values())}
+            ret.setdefault(raw["item_type"], []).append(raw)
+        return ret
+
+    def consume(self, before: datetime):
+        """
+        consume drops the events before the given time, the queue then holds every event since that time.
+        This should be called with the start of the next digest window once the digest is posted.
+
+        args:
+            before: datetime - the start of the next digest window
+        """
+        since, records = self.read()
+        if not since:
+            return
+        kept = [record for record in records if datetimehelper.convertToDateTime(record["time"]) >= before]
+        self._replace(max(since, datetimehelper.format_to_utc(before)), kept)
@@ -0,0 +1,85 @@
+import sys
+from git_structures import GitIssue
+
+VALID_STATES = ["open", "closed"]
+
+def quote_value(value: str) -> str:
+    """
+    quote_value wraps a search qualifier value in quotes if it contains spaces.
+
+    args:
+        value: str - the value to quote
+    """
+    return f'"{value}"' if " " in value else value
+
+class DigestFilter:
+    """
+    DigestFilter describes which issues should be included in a digest.
+    The filter is sent to GitHub as search qualifiers so that unwanted issues are never downloaded,
+    it can also be applied to already fetched issues to split them across several digests.
+
+    args:
+        setting: dict - the filter setting, with the following optional fields
+            - labels: list[str] - only include issues with any of these labels
+            - exclude_labels: list[str] - exclude issues with any of these labels
+            - authors: list[str] - only include issues created by any of these users
+            - state: str - only include issues in this state, either "open" or "closed"
+            - milestone: str - only include issues in this milestone
+    """
+    labels: list[str]
+    exclude_labels: list[str]
+    authors: list[str]
+    state: str
+    milestone: str
+
+    def __init__(self, setting: dict = None):
+        setting = setting or {}
+        self.labels = setting.get("labels", [])
+        self.exclude_labels = setting.get("exclude_labels", [])
+        self.authors = setting.get("authors", [])
+        self.state = setting.get("state", "").lower()
+        self.milestone = setting.get("milestone", "")
+
+        if self.state and self.state not in VALID_STATES:
+            print(f"Unknown issue state {self.state} in filters, ignoring it.", file=sys.stderr)
+            self.state = ""
+
+    def to_search_qualifiers(self) -> str:
+        """
+        to_search_qualifiers converts the filter into GitHub search qualifiers.
+
+        returns:
+            str - the search qualifiers, each prefixed with a space
+        """
+        qualifiers = []
+        if self.labels:
+            qualifiers.append("label:" + ",".join(quote_value(label) for label in self.labels))
+        qualifiers.extend(f"-label:{quote_value(label)}" for label in self.exclude_labels)
+        qualifiers.extend(f"author:{author}" for author in self.authors)
+        if self.state:
+            qualifiers.append(f"is:{self.state}")
+        if self.milestone:
+            qualifiers.append(f"milestone:{quote_value(self.milestone)}")
+        return "".join(f" {qualifier}" for qualifier in qualifiers)
+
+    def matches(self, issue: GitIssue) -> bool:
+        """
+        matches returns true if the already fetched issue satisfies the filter, this follows the same
+        rules as the search qualifiers returned by to_search_qualifiers.
+
+        args:
+            issue: GitIssue - the issue to check
+        """
+        # search qualifiers ignore case, so the values are compared case-insensitively
+        labels = {label.casefold() for label in issue.labels}
+        if self.labels and not {label.casefold() for label in self.labels} & labels:
+            return False
+        if {label.casefold() for label in self.exclude_labels} & labels:
+            return False
+        if self.authors and (issue.author or "").casefold() not in {author.casefold() for author in self.authors}:
+            return False
+        if self.state and issue.closed != (self.state == "closed"):
+            return False
+        if self.milestone and (issue.milestone or "").casefold() != self.milestone.casefold():
+            return False
+        return True
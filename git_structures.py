@@ -1,12 +1,15 @@
 from datetime import datetime
-from gql_queries import ReadComments
+from gql_queries import ReadComments, ReadReviews, ReadTimeline
 import datetimehelper
-from stringhelper import format_to_quote, replace_references
+from stringhelper import format_diff, sanitize_markdown
+
+MAX_QUOTE_SIZE = 32768 # longer bodies are cut so that a single body cannot take up the whole digest
+MAX_EDIT_DIFF_SIZE = 8192 # longer diffs of edited bodies are shown as the whole body instead
 
 issue_title_template = "# {title} [#{number}]({link})\n"
 
 issue_template = """
-`@{author}` {status} this issue on {date}
+`@{author}` {status} this {kind} on {date}
 {body}
 
 
@@ -17,14 +20,34 @@ comment_template = """
 {body}
 
 
+"""
+
+event_template = """
+`@{actor}` {action} on {date}
+
 """
 
 issue_simple_link_template = "[#{number}]({link})"
 
+def quote_body(body: str, previous_body: str = None) -> str:
+    """
+    quote_body formats a body as a quote. If the body before the edit is known, only the changed lines
+    are shown, unless the diff is not shorter than the whole body.
+
+    args:
+        body: str - the current body
+        previous_body: str - the body before the edit, default to unknown
+    """
+    quote = sanitize_markdown(body, MAX_QUOTE_SIZE)
+    if previous_body is not None:
+        return format_diff(previous_body, body, min(len(quote) - 1, MAX_EDIT_DIFF_SIZE)) or quote
+    return quote
+
 class ModifiableItem:
     """
     ModifiableItem is a base class for GraphQL objects that can be modified.
     These objects should contain the following fields in the query:
+        - id: str
         - author: str
         - created_at: datetime
         - editor: str
@@ -34,11 +57,13 @@ class ModifiableItem:
         graphqlResult: dict - the result of the GraphQL query
     """
 
+    id: str
     editor: str
     edit_at: datetime
     author: str
     created_at: datetime
     def __init__(self, graphqlResult: dict):
+        self.id = graphqlResult["id"]
         self.editor = graphqlResult["editor"]["login"] if graphqlResult["editor"] else None
         self.edit_at = datetimehelper.convertToDateTime(graphqlResult["lastEditedAt"]) if graphqlResult["lastEditedAt"] else None
         self.author = graphqlResult["author"]["login"]
@@ -98,6 +123,28 @@ class ModifiableItem:
     def within_time_range(self, time_range: tuple[datetime, datetime]) -> bool:
         return self.last_change_date >= time_range[0] and self.last_change_date <= time_range[1]
 
+    def to_dict(self) -> dict:
+        """
+        to_dict returns the item in the shape of the GraphQL result it was created from,
+        so that it can be stored and created again later.
+        """
+        return {
+            "id": self.id,
+            "author": {"login": self.author},
+            "createdAt": datetimehelper.format_to_utc(self.created_at),
+            "lastEditedAt": datetimehelper.format_to_utc(self.edit_at) if self.edit_at else None,
+            "editor": {"login": self.editor} if self.editor else None,
+        }
+
+    def already_digested(self, digested: dict[str, str]) -> bool:
+        """
+        already_digested returns true if the current version of the item was reported by a previous digest.
+
+        args:
+            digested: dict[str, str] - mapping of item id to the UTC timestamp of the last digested change
+        """
+        return self.id in digested and self.last_change_date <= datetimehelper.convertToDateTime(digested[self.id])
+
 class GitComment(ModifiableItem):
     """
     GitComment is a class representing a comment on a GitHub issue.
@@ -109,13 +156,18 @@ class GitComment(ModifiableItem):
 
     source_link: str
     body: str
+    previous_body: str | None
     time_range: tuple[datetime, datetime]
     def __init__(self, graphqlResult: dict, time_range: tuple[datetime, datetime]):
         super().__init__(graphqlResult)
         self.source_link = graphqlResult["url"]
-        self.body = replace_references(graphqlResult["body"])
+        self.body = graphqlResult["body"]
+        self.previous_body = None
         self.time_range = time_range
 
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "url": self.source_link, "body": self.body}
+
     def to_markdown(self) -> str:
         """
         to_markdown returns a markdown representation of the comment.
@@ -127,7 +179,7 @@ class GitComment(ModifiableItem):
                 author=self.last_change_author,
                 link=self.source_link,
                 date=datetimehelper.format_local(self.last_change_date),
-                body=format_to_quote(self.body),
+                body=quote_body(self.body, self.previous_body),
                 status=self.get_status_str(self.time_range)
             )
 
@@ -142,38 +194,149 @@ class GitComment(ModifiableItem):
         return self.body == None
     
 
+class GitTimelineEvent:
+    """
+    GitTimelineEvent is a class representing an event on the timeline of an issue or pull request,
+    such as closing, reopening, labelling, assignment or a cross reference.
+
+    args:
+        graphqlResult: dict - the result of the GraphQL query
+    """
+
+    id: str
+    event_type: str
+    actor: str
+    created_at: datetime
+    action: str
+    raw: dict
+    def __init__(self, graphqlResult: dict):
+        self.raw = graphqlResult
+        self.id = graphqlResult["id"]
+        self.event_type = graphqlResult["__typename"]
+        self.actor = graphqlResult["actor"]["login"] if graphqlResult["actor"] else "ghost"
+        self.created_at = datetimehelper.convertToDateTime(graphqlResult["createdAt"])
+        self.action = self.describe(graphqlResult)
+
+    @staticmethod
+    def describe(graphqlResult: dict) -> str:
+        """
+        describe returns a short description of what happened in the event.
+
+        args:
+            graphqlResult: dict - the result of the GraphQL query
+        """
+        event_type = graphqlResult["__typename"]
+        if event_type in ("LabeledEvent", "UnlabeledEvent"):
+            verb = "added" if event_type == "LabeledEvent" else "removed"
+            return f"{verb} the `{graphqlResult['label']['name']}` label"
+        if event_type in ("AssignedEvent", "UnassignedEvent"):
+            assignee = (graphqlResult["assignee"] or {}).get("login", "ghost")
+            verb = "assigned" if event_type == "AssignedEvent" else "unassigned"
+            return f"{verb} `@{assignee}`"
+        if event_type == "CrossReferencedEvent":
+            source = graphqlResult["source"] or {}
+            if "url" in source:
+                return f"referenced this in [#{source['number']}]({source['url']})"
+            return "referenced this"
+        return {
+            "ClosedEvent": "closed this",
+            "ReopenedEvent": "reopened this",
+            "MergedEvent": "merged this",
+        }.get(event_type, event_type)
+
+    @property
+    def last_change_date(self) -> datetime:
+        """
+        last_change_date returns the date of the event, events cannot be modified.
+        """
+        return self.created_at
+
+    def within_time_range(self, time_range: tuple[datetime, datetime]) -> bool:
+        return self.created_at >= time_range[0] and self.created_at <= time_range[1]
+
+    def to_dict(self) -> dict:
+        """
+        to_dict returns the GraphQL result the event was created from.
+        """
+        return self.raw
+
+    def already_digested(self, digested: dict[str, str]) -> bool:
+        """
+        already_digested returns true if the event was reported by a previous digest.
+
+        args:
+            digested: dict[str, str] - mapping of item id to the UTC timestamp of the last digested change
+        """
+        return self.id in digested
+
+    def to_markdown(self) -> str:
+        """
+        to_markdown returns a markdown representation of the event.
+
+        returns:
+            str - the markdown representation of the event
+        """
+        return event_template.format(
+                actor=self.actor,
+                action=self.action,
+                date=datetimehelper.format_local(self.created_at)
+            )
+
 class GitIssue(ModifiableItem):
     """
     GitIssue is a class representing a GitHub issue.
+    It is also the base class for the other item types that have a title, a body and comments.
 
     args:
         graphqlResult: dict - the result of the GraphQL query
         time_range: tuple[datetime, datetime] - the time range to check
+        digested: dict[str, str] - items already reported by a previous digest, these are skipped
     """
 
+    kind: str = "issue"
+    item_type: str = "issue"
     url: str
     number: int
     time_range: tuple[datetime, datetime]
     title: str
-    id: str
     body: str
+    previous_body: str | None
+    closed: bool
+    closed_at: datetime | None
+    labels: list[str]
+    milestone: str | None
     comments: list[GitComment]
     comments_query: ReadComments
     last_comment_cursor: str
     has_more_comments: bool
+    events: list[GitTimelineEvent]
+    timeline_query: ReadTimeline
+    last_timeline_cursor: str
+    has_more_events: bool
+    digested: dict[str, str]
 
-    def __init__(self, graphqlResult: dict, timeRange: tuple[datetime, datetime]):
+    def __init__(self, graphqlResult: dict, timeRange: tuple[datetime, datetime], digested: dict[str, str] = None):
         super().__init__(graphqlResult)
         self.url = graphqlResult["url"]
         self.number = graphqlResult["number"]
         self.time_range = timeRange
         self.title = graphqlResult["title"]
-        self.id = graphqlResult["id"]
-        self.body = replace_references(graphqlResult["body"])
+        self.closed = graphqlResult["closed"]
+        self.closed_at = datetimehelper.convertToDateTime(graphqlResult["closedAt"]) if graphqlResult.get("closedAt") else None
+        self.labels = [label["name"] for label in graphqlResult["labels"]["nodes"]]
+        self.milestone = graphqlResult["milestone"]["title"] if graphqlResult.get("milestone") else None
+        self.digested = digested or {}
+        self.body = graphqlResult["body"]
+        self.previous_body = None
         self.comments = []
         self.comments_query = ReadComments(self.id)
+        self.events = []
+        self.timeline_query = ReadTimeline(f"{self.id}_timeline")
+        self.has_more_events = False
         
         self.read_paginated_comments(graphqlResult)
+        if "timelineItems" in graphqlResult:
+            self.read_paginated_timeline(graphqlResult)
 
     def read_paginated_comments(self, graphqlResult:dict):
         """
@@ -184,12 +347,91 @@ class GitIssue(ModifiableItem):
 
         for raw_comment in graphqlResult["comments"]["nodes"]:
             comment = GitComment(raw_comment, self.time_range)
-            if comment.within_time_range(self.time_range) and not comment.is_deleted:
+            if comment.within_time_range(self.time_range) and not comment.is_deleted and not comment.already_digested(self.digested):
                 self.comments.append(comment)
     
+    def read_paginated_timeline(self, graphqlResult: dict):
+        """
+        read_paginated_timeline reads the timeline events of the issue.
+        The events are already limited to the time range by the query, only the end of the range is checked here.
+        """
+        self.last_timeline_cursor = graphqlResult["timelineItems"]["pageInfo"]["endCursor"] or "null"
+        self.has_more_events = graphqlResult["timelineItems"]["pageInfo"]["hasNextPage"]
+
+        for raw_event in graphqlResult["timelineItems"]["nodes"]:
+            event = GitTimelineEvent(raw_event)
+            if event.within_time_range(self.time_range) and not event.already_digested(self.digested):
+                self.events.append(event)
+
     def draft_gql_query(self) -> str:
-        return self.comments_query.partial_query(self.url, self.last_comment_cursor)
+        """
+        draft_gql_query returns the partial queries to read the next page of comments and timeline events,
+        for the ones that have more pages.
+        """
+        queries = []
+        if self.has_more_comments:
+            queries.append(self.comments_query.partial_query(self.url, self.last_comment_cursor))
+        if self.has_more_events:
+            queries.append(self.timeline_query.partial_query(
+                self.url, self.last_timeline_cursor, datetimehelper.format_to_utc(self.time_range[0])))
+        return ",".join(queries)
+
+    def read_paginated_result(self, graphqlResult: dict) -> dict[str, dict]:
+        """
+        read_paginated_result reads the pages requested by draft_gql_query from the result of the query.
+
+        args:
+            graphqlResult: dict - the result of the query
+
+        returns:
+            dict[str, dict] - the raw pages that were read, by connection name, so that they can be replayed
+        """
+        pages = {}
+        if self.comments_query.id in graphqlResult:
+            pages["comments"] = self.comments_query.read_result(graphqlResult)
+        if self.timeline_query.id in graphqlResult:
+            pages["timeline"] = self.timeline_query.read_result(graphqlResult)
+        self.read_pages(pages)
+        return pages
+
+    def read_pages(self, pages: dict[str, dict]):
+        """
+        read_pages reads the raw pages returned by read_paginated_result.
+
+        args:
+            pages: dict[str, dict] - the raw pages by connection name
+        """
+        if "comments" in pages:
+            self.read_paginated_comments(pages["comments"])
+        if "timeline" in pages:
+            self.read_paginated_timeline(pages["timeline"])
     
+    def to_dict(self) -> dict:
+        """
+        to_dict returns the issue with the comments and timeline events read so far in the shape of
+        the GraphQL result, so that it can be stored and created again later.
+        The item type is included so that the right class can be used to create it again.
+        """
+        return {
+            **super().to_dict(),
+            "item_type": self.item_type,
+            "url": self.url,
+            "number": self.number,
+            "title": self.title,
+            "body": self.body,
+            "closed": self.closed,
+            "labels": {"nodes": [{"name": label} for label in self.labels]},
+            "milestone": {"title": self.milestone} if self.milestone else None,
+            "comments": {
+                "pageInfo": {"endCursor": None, "hasNextPage": False},
+                "nodes": [comment.to_dict() for comment in self.comments],
+            },
+            "timelineItems": {
+                "pageInfo": {"endCursor": None, "hasNextPage": False},
+                "nodes": [event.to_dict() for event in self.events],
+            },
+        }
+
     @property
     def simple_link(self) -> str:
         """
@@ -202,17 +444,17 @@ class GitIssue(ModifiableItem):
 
     @property
     def contains_changes(self) -> bool:
-        return self.within_time_range(self.time_range)
+        return self.within_time_range(self.time_range) and not self.already_digested(self.digested)
 
     @property
     def has_more_data(self) -> bool:
         """
-        has_more_data returns true if there are more comments to read, false otherwise.
+        has_more_data returns true if there are more comments or timeline events to read, false otherwise.
 
         returns:
-            bool - true if there are more comments to read, false otherwise
+            bool - true if there are more comments or timeline events to read, false otherwise
         """
-        return self.has_more_comments
+        return self.has_more_comments or self.has_more_events
     
     @property
     def total_changes(self) -> int:
@@ -222,7 +464,7 @@ class GitIssue(ModifiableItem):
         returns:
             int - the total number of changes of the issue
         """
-        return len(self.comments) + self.contains_changes
+        return len(self.comments) + len(self.events) + self.contains_changes
     
     def to_markdown(self) -> str:
         """
@@ -240,7 +482,95 @@ class GitIssue(ModifiableItem):
                 author=self.last_change_author,
                 date=datetimehelper.format_local(self.last_change_date),
                 status=self.get_status_str(self.time_range),
-                body=format_to_quote(self.body)
+                kind=self.kind,
+                body=quote_body(self.body, self.previous_body)
             )
-        self.comments.sort(key=lambda x: x.last_change_date)
-        return header + ''.join([comment.to_markdown() for comment in self.comments])
+        activity = sorted(self.comments + self.events, key=lambda x: x.last_change_date)
+        return header + ''.join([item.to_markdown() for item in activity])
+
+class GitPullRequest(GitIssue):
+    """
+    GitPullRequest is a class representing a GitHub pull request.
+    Reviews and review comments are reported together with the conversation comments.
+
+    args:
+        graphqlResult: dict - the result of the GraphQL query
+        time_range: tuple[datetime, datetime] - the time range to check
+        digested: dict[str, str] - items already reported by a previous digest, these are skipped
+    """
+    kind: str = "pull request"
+    item_type: str = "pull_request"
+    reviews_query: ReadReviews
+    first_review_cursor: str
+    has_more_reviews: bool
+
+    def __init__(self, graphqlResult: dict, timeRange: tuple[datetime, datetime], digested: dict[str, str] = None):
+        super().__init__(graphqlResult, timeRange, digested)
+        self.reviews_query = ReadReviews(f"{self.id}_reviews")
+        self.has_more_reviews = False
+        if "reviews" in graphqlResult:
+            # not the case when created again from to_dict, the reviews are already part of the comments
+            self.read_paginated_reviews(graphqlResult)
+
+    def read_paginated_reviews(self, graphqlResult: dict):
+        """
+        read_paginated_reviews reads the reviews and review comments of the pull request, newest first.
+        Reviews without a body (e.g. plain approvals) only contribute their comments.
+        Older pages are only read while the oldest review read so far was submitted within the time range,
+        an older review edited within the time range is not read unless it is on a page read anyway.
+        """
+        page = graphqlResult["reviews"]
+        raw_reviews = page["nodes"]
+        self.first_review_cursor = page["pageInfo"]["startCursor"] or "null"
+        self.has_more_reviews = page["pageInfo"]["hasPreviousPage"] and bool(raw_reviews) and \
+            datetimehelper.convertToDateTime(raw_reviews[0]["createdAt"]) >= self.time_range[0]
+
+        for raw_review in raw_reviews:
+            raw_items = raw_review["comments"]["nodes"]
+            if raw_review["body"]:
+                raw_items = [raw_review] + raw_items
+            for raw_item in raw_items:
+                comment = GitComment(raw_item, self.time_range)
+                if comment.within_time_range(self.time_range) and not comment.already_digested(self.digested):
+                    self.comments.append(comment)
+
+    def draft_gql_query(self) -> str:
+        queries = [super().draft_gql_query()] if super().has_more_data else []
+        if self.has_more_reviews:
+            queries.append(self.reviews_query.partial_query(self.url, self.first_review_cursor))
+        return ",".join(queries)
+
+    def read_paginated_result(self, graphqlResult: dict) -> dict[str, dict]:
+        pages = super().read_paginated_result(graphqlResult)
+        if self.reviews_query.id in graphqlResult:
+            pages["reviews"] = self.reviews_query.read_result(graphqlResult)
+            self.read_paginated_reviews(pages["reviews"])
+        return pages
+
+    def read_pages(self, pages: dict[str, dict]):
+        super().read_pages(pages)
+        if "reviews" in pages:
+            self.read_paginated_reviews(pages["reviews"])
+
+    @property
+    def has_more_data(self) -> bool:
+        return super().has_more_data or self.has_more_reviews
+
+class GitDiscussion(GitIssue):
+    """
+    GitDiscussion is a class representing a GitHub discussion.
+    Only top level comments are reported, replies to comments are not fetched.
+
+    args:
+        graphqlResult: dict - the result of the GraphQL query
+        time_range: tuple[datetime, datetime] - the time range to check
+        digested: dict[str, str] - items already reported by a previous digest, these are skipped
+    """
+    kind: str = "discussion"
+    item_type: str = "discussion"
+
+item_classes: dict[str, type[GitIssue]] = {
+    "issue": GitIssue,
+    "pull_request": GitPullRequest,
+    "discussion": GitDiscussion,
+}
@@ -14,17 +14,25 @@ except KeyError:
     print("Token not available!", file=sys.stderr)
     exit(1)
 
-url = "https://api.github.com/graphql"
+url = environ.get("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
 headers = {
     "Authorization": f"token {API_KEY}",
 }
+# a shared session keeps the connection to GitHub alive between requests
+session = requests.Session()
+session.headers.update(headers)
 
-def handle_errors(response: requests.Response) -> None:
+def handle_errors(response: requests.Response) -> dict:
     """
-    If query fails, print the error message and exit the program
+    If query fails, print the error message and exit the program.
+    The response body is decoded only once here, callers should use the returned data
+    instead of decoding the response again.
 
     args:
         response: requests.Response - the response object
+
+    returns:
+        dict - the data field of the response
     """
     if response.status_code != 200:
         print("Query failed to run by returning code of {}. {}".format(response.status_code, response.text), file=sys.stderr)
@@ -36,6 +44,7 @@ def handle_errors(response: requests.Response) -> None:
         for error in errors:
             print("Error: {}".format(error["message"]), file=sys.stderr)
         exit(1)
+    return data["data"]
 
 def run_queries(queries: list[str]) -> dict:
     """
@@ -51,9 +60,8 @@ def run_queries(queries: list[str]) -> dict:
         "query": f"{{{','.join([q for q in queries])}}}"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
-    handle_errors(response)
-    return response.json()["data"]
+    response = session.post(url, json=payload)
+    return handle_errors(response)
 
 def run_mutations(queries: list[str]) -> dict:
     """
@@ -69,10 +77,9 @@ def run_mutations(queries: list[str]) -> dict:
         "query": f"mutation {{{','.join([q for q in queries])}}}"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    response = session.post(url, json=payload)
 
-    handle_errors(response)
-    return response.json()["data"]
+    return handle_errors(response)
 
 class GithubQuery:
     """
@@ -103,9 +110,8 @@ class GithubQuery:
             "query": f"{'mutation ' if self.mutation else ''}{{{self.partial_query(**kwargs)}}}"
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-        handle_errors(response)
-        return response.json()["data"]
+        response = session.post(url, json=payload)
+        return handle_errors(response)
 
     def partial_query(self, **kwargs) -> str:
         """
@@ -145,7 +151,7 @@ class AddComment(GithubQuery):
         return super().partial_query(issue_id=issue_id, comment_body=comment_body)
     
     def run(self, issue_id:str, comment_body:str) -> dict:
-        comment_body = escape_special_chars(comment_body)
+        # escaped by partial_query
         return super().run(issue_id=issue_id, comment_body=comment_body)
 
 class CreateIssue(GithubQuery):
@@ -165,8 +171,7 @@ class CreateIssue(GithubQuery):
         return super().partial_query(repo_id=repo_id, title=title, body=body)
     
     def run(self, repo_id:str, title:str, body:str) -> dict:
-        title = escape_special_chars(title)
-        body = escape_special_chars(body)
+        # escaped by partial_query
         return super().run(repo_id=repo_id, title=title, body=body)
     
     def get_issue_id(self, graphqlResult: dict) -> str:
@@ -201,14 +206,14 @@ class UpdateIssue(GithubQuery):
         id: str - the id of the query
     """
     def __init__(self, id: str):
-        super().__init__(update_issue_template, id)
+        super().__init__(update_issue_template, id, mutation=True)
 
     def partial_query(self, issue_id:str, issue_body:str) -> str:
         issue_body = escape_special_chars(issue_body)
         return super().partial_query(issue_id=issue_id, issue_body=issue_body)
     
     def run(self, issue_id:str, issue_body:str) -> dict:
-        issue_body = escape_special_chars(issue_body)
+        # escaped by partial_query
         return super().run(issue_id=issue_id, issue_body=issue_body)
 
 class FindRepoId(GithubQuery):
@@ -286,25 +291,92 @@ class ReadComments(GithubQuery):
     def run(self, url: str, cursor: str) -> str:
         return super().run(url=url, cursor=cursor)
 
-class ReadIssueLock(GithubQuery):
+class ReadTimeline(GithubQuery):
+    """
+    ReadTimeline represents a GraphQL query to read the timeline events of an issue or pull request since a given time
+
+    args:
+        id: str - the id of the query
+    """
+    def __init__(self, id: str):
+        super().__init__(read_timeline_template, id)
+
+    def partial_query(self, url: str, cursor: str, timestamp: str) -> str:
+        return super().partial_query(url=url, cursor=cursor, timestamp=timestamp)
+
+    def run(self, url: str, cursor: str, timestamp: str) -> dict:
+        return super().run(url=url, cursor=cursor, timestamp=timestamp)
+
+class ReadReviews(GithubQuery):
+    """
+    ReadReviews represents a GraphQL query to read the reviews of a pull request before a cursor, newest first
+
+    args:
+        id: str - the id of the query
+    """
+    def __init__(self, id: str):
+        super().__init__(read_reviews_template, id)
+
+    def partial_query(self, url: str, cursor: str) -> str:
+        return super().partial_query(url=url, cursor=cursor)
+
+    def run(self, url: str, cursor: str) -> dict:
+        return super().run(url=url, cursor=cursor)
+
+class ReadContentEdits(GithubQuery):
+    """
+    ReadContentEdits represents a GraphQL query to read the last edits of the body of an issue or comment
+
+    args:
+        id: str - the id of the query
+    """
+    def __init__(self, id: str):
+        super().__init__(read_content_edits_template, id)
+
+    def partial_query(self, item_id: str, count: int) -> str:
+        return super().partial_query(item_id=item_id, count=count)
+
+    def run(self, item_id: str, count: int) -> dict:
+        return super().run(item_id=item_id, count=count)
+
+    def get_body_before(self, graphqlResult: dict, before: datetime) -> str | None:
+        """
+        get_body_before returns the body as it was before the given time, the diff field of an edit holds
+        the whole body after the edit.
+
+        args:
+            graphqlResult: dict - the result of the query
+            before: datetime - the time to read the body at
+
+        returns:
+            str | None - the body, or None if it was edited more times since than were read
+        """
+        res = self.read_result(graphqlResult)
+        edits = res.get("userContentEdits", {}).get("nodes", []) if res else []
+        earlier = [edit for edit in edits if edit["diff"] is not None and datetimehelper.convertToDateTime(edit["editedAt"]) < before]
+        if not earlier:
+            return None
+        return max(earlier, key=lambda edit: edit["editedAt"])["diff"]
+
+class ReadDigestIssue(GithubQuery):
     """
-    CheckLockState represents a GraphQL query to check the lock state of an issue
+    ReadDigestIssue represents a GraphQL query to read the lock state, the body and the last comments of a digest issue
 
     args:
         id: str - the id of the query
     """
     def __init__(self, id: str):
-        super().__init__(check_lock_state_template, id)
+        super().__init__(read_digest_issue_template, id)
     
-    def partial_query(self, issue_id: str) -> str:
-        return super().partial_query(issue_id=issue_id)
+    def partial_query(self, issue_id: str, count: int) -> str:
+        return super().partial_query(issue_id=issue_id, count=count)
     
-    def run(self, issue_id: str) -> dict:
-        return super().run(issue_id=issue_id)
+    def run(self, issue_id: str, count: int) -> dict:
+        return super().run(issue_id=issue_id, count=count)
     
     def is_locked(self, graphqlResult: dict) -> bool:
         """
-        get_locked returns whether the issue is locked
+        is_locked returns whether the issue is locked
 
         args:
             graphqlResult: dict - the result of the query
@@ -314,6 +386,24 @@ class ReadIssueLock(GithubQuery):
         """
         return self.read_result(graphqlResult)["locked"]
 
+    def get_body(self, graphqlResult: dict) -> str:
+        """
+        get_body returns the body of the issue
+
+        args:
+            graphqlResult: dict - the result of the query
+        """
+        return self.read_result(graphqlResult)["body"]
+
+    def get_comment_bodies(self, graphqlResult: dict) -> list[str]:
+        """
+        get_comment_bodies returns the bodies of the last comments of the issue, oldest first
+
+        args:
+            graphqlResult: dict - the result of the query
+        """
+        return [comment["body"] for comment in self.read_result(graphqlResult)["comments"]["nodes"]]
+
 class LockIssue(GithubQuery):
     """
     LockIssue represents a GraphQL mutation to lock an issue
@@ -346,19 +436,291 @@ class UnlockIssue(GithubQuery):
     def run(self, issue_id: str) -> dict:
         return super().run(issue_id=issue_id)
 
-class MainQuery(GithubQuery):
+class RateLimit(GithubQuery):
     """
-    MainQuery represents a GraphQL query to read the issues in a repository based on update time range
+    RateLimit represents a GraphQL query to read the rate limit of the token. In a dry run,
+    the cost of the rest of the document is calculated without running it.
+
+    args:
+        id: str - the id of the query
     """
-    def __init__(self):
-        super().__init__(main_query_template, "main")
+    def __init__(self, id: str):
+        super().__init__(rate_limit_template, id)
+
+    def partial_query(self, dry_run: bool = False) -> str:
+        return super().partial_query(dry_run="true" if dry_run else "false")
 
-    def partial_query(self, repo: str, timestamp: str, cursor: str = None) -> str:
+    def run(self, dry_run: bool = False) -> dict:
+        return super().run(dry_run="true" if dry_run else "false")
+
+class SearchQuery(GithubQuery):
+    """
+    SearchQuery represents a GraphQL query to search for one type of item in a repository based on update time range
+
+    args:
+        query: Template - the search template of the item type
+        id: str - the id of the query
+    """
+    applies_qualifiers = True
+
+    def __init__(self, query: Template, id: str):
+        super().__init__(query, id)
+
+    def partial_query(self, repo: str, timestamp: str, cursor: str = None, qualifiers: str = "", window: tuple[str, str] = None) -> str:
         if not cursor:
             cursor = "null"
         else:
             cursor = f'"{cursor}"'
-        return super().partial_query(repo=repo, timestamp=timestamp, cursor=cursor)
+        qualifiers = escape_special_chars(qualifiers)
+        # comments and events are always read from the timestamp, the search can be limited to the items last updated in a window
+        start, end = window or (timestamp, None)
+        updated = f"{start}..{end}" if end else f">={start}"
+        return super().partial_query(repo=repo, timestamp=timestamp, cursor=cursor, qualifiers=qualifiers, updated=updated)
     
-    def run(self, repo: str, timestamp: str, cursor: str = None) -> str:
-        return super().run(repo=repo, timestamp=timestamp, cursor=cursor)
+    def run(self, repo: str, timestamp: str, cursor: str = None, qualifiers: str = "", window: tuple[str, str] = None) -> str:
+        return super().run(repo=repo, timestamp=timestamp, cursor=cursor, qualifiers=qualifiers, window=window)
+
+    def read_result(self, graphql_result: dict, window: tuple[str, str] = None) -> dict:
+        # the window is already applied by the search
+        return super().read_result(graphql_result)
+
+class RepositoryIssues(GithubQuery):
+    """
+    RepositoryIssues represents a GraphQL query to list the issues of a repository updated since a time, oldest update first.
+    Unlike SearchQuery, it is not limited to 1000 results and has no index lag, but search qualifiers cannot be applied.
+
+    args:
+        id: str - the id of the query
+    """
+    applies_qualifiers = False
+
+    def __init__(self, id: str):
+        super().__init__(repository_issues_template, id)
+
+    def partial_query(self, repo: str, timestamp: str, cursor: str = None, qualifiers: str = "", window: tuple[str, str] = None) -> str:
+        # the qualifiers are checked by the caller
+        if not cursor:
+            cursor = "null"
+        else:
+            cursor = f'"{cursor}"'
+        owner, name = repo.split("/")
+        since = window[0] if window else timestamp
+        return super().partial_query(owner=owner, name=name, cursor=cursor, since=since, timestamp=timestamp)
+
+    def run(self, repo: str, timestamp: str, cursor: str = None, qualifiers: str = "", window: tuple[str, str] = None) -> dict:
+        return super().run(repo=repo, timestamp=timestamp, cursor=cursor, qualifiers=qualifiers, window=window)
+
+    def read_result(self, graphql_result: dict, window: tuple[str, str] = None) -> dict:
+        """
+        read_result reads the listed issues. The end of a window cannot be set on the listing, but the issues
+        are sorted by update time, so the pagination stops as soon as an issue updated after the window is listed.
+
+        args:
+            graphql_result: dict - the result of the query
+            window: tuple[str, str] - the window the query was made for, see partial_query
+        """
+        res = graphql_result[self.id]["issues"]
+        nodes = res["nodes"]
+        if window and window[1]:
+            until = datetimehelper.convertToDateTime(window[1])
+            for i, node in enumerate(nodes):
+                if node and datetimehelper.convertToDateTime(node["updatedAt"]) > until:
+                    return {"pageInfo": {**res["pageInfo"], "hasNextPage": False}, "nodes": nodes[:i]}
+        return res
+
+# the item types that can be listed from the repository instead of searched
+item_repository_sources = {
+    "issue": RepositoryIssues,
+}
+
+item_search_templates = {
+    "issue": main_query_template,
+    "pull_request": pull_request_query_template,
+    "discussion": discussion_query_template,
+}
+
+class ItemCount(GithubQuery):
+    """
+    ItemCount represents a GraphQL query to count the items of one type in a repository updated since a time
+
+    args:
+        query: Template - the count template of the item type
+        id: str - the id of the query
+    """
+    def __init__(self, query: Template, id: str):
+        super().__init__(query, id)
+
+    def partial_query(self, repo: str, timestamp: str, qualifiers: str = "") -> str:
+        return super().partial_query(repo=repo, timestamp=timestamp, qualifiers=escape_special_chars(qualifiers))
+
+    def run(self, repo: str, timestamp: str, qualifiers: str = "") -> dict:
+        return super().run(repo=repo, timestamp=timestamp, qualifiers=qualifiers)
+
+    def get_count(self, graphqlResult: dict) -> int:
+        """
+        get_count returns the number of items found
+
+        args:
+            graphqlResult: dict - the result of the query
+        """
+        res = self.read_result(graphqlResult)
+        return res.get("issueCount", res.get("discussionCount", 0))
+
+class UpdatedIssueNumbers(GithubQuery):
+    """
+    UpdatedIssueNumbers represents a GraphQL query for the numbers and last update times of the issues of a repository
+    updated since a time
+
+    args:
+        id: str - the id of the query
+    """
+    def __init__(self, id: str):
+        super().__init__(updated_issue_numbers_template, id)
+
+    def partial_query(self, repo: str, timestamp: str, count: int) -> str:
+        return super().partial_query(repo=repo, timestamp=timestamp, count=count)
+
+    def run(self, repo: str, timestamp: str, count: int) -> dict:
+        return super().run(repo=repo, timestamp=timestamp, count=count)
+
+    def get_updates(self, graphqlResult: dict) -> dict[int, str] | None:
+        """
+        get_updates returns the last update time of the issues found
+
+        args:
+            graphqlResult: dict - the result of the query
+
+        returns:
+            dict[int, str] | None - the UTC update time by issue number, or None if there were more issues than the query returns
+        """
+        res = self.read_result(graphqlResult)
+        updates = {node["number"]: node["updatedAt"] for node in res["nodes"] if node}
+        return updates if res["issueCount"] <= len(updates) else None
+
+item_count_templates = {
+    "issue": issue_count_template,
+    "pull_request": pull_request_count_template,
+    "discussion": discussion_count_template,
+}
+
+# the page size of each search template
+item_page_sizes = {
+    "issue": 100,
+    "pull_request": 50,
+    "discussion": 100,
+}
+
+class MainQuery:
+    """
+    MainQuery represents the GraphQL queries to read the items in a repository based on update time range.
+    Each item type is read under its own alias, so all types are paginated jointly in the same requests.
+
+    args:
+        item_types: list[str] - the item types to read, any of "issue", "pull_request" and "discussion"
+        source: str - "search" to search for the items, or "repository" to list the items of the repository where
+            possible (issues only), default to search
+    """
+    sources: dict[str, SearchQuery | RepositoryIssues]
+    counters: dict[str, ItemCount]
+    activity_counters: dict[tuple[str, str], ItemCount]
+
+    def __init__(self, item_types: list[str] = ["issue"], source: str = "search"):
+        self.sources = {
+            item_type: item_repository_sources[item_type](item_type)
+            if source == "repository" and item_type in item_repository_sources
+            else SearchQuery(item_search_templates[item_type], item_type)
+            for item_type in item_types
+        }
+        self.counters = {
+            item_type: ItemCount(item_count_templates[item_type], f"{item_type}_count")
+            for item_type in item_types
+        }
+        # issues and pull requests opened and closed in the time range, these are a subset of the items updated in it
+        self.activity_counters = {
+            (item_type, qualifier): ItemCount(item_count_templates[item_type], f"{item_type}_{qualifier}_count")
+            for item_type in item_types if item_type in ("issue", "pull_request")
+            for qualifier in ("created", "closed")
+        }
+
+    def partial_query(self, repo: str, timestamp: str, cursors: dict[str, str], complete: dict[str, bool], qualifiers: str = "",
+                      window: tuple[str, str] = None) -> str:
+        """
+        partial_query returns the aliased search queries of the item types whose pagination is not complete
+
+        args:
+            repo: str - the repository to search
+            timestamp: str - the UTC start of the time range
+            cursors: dict[str, str] - the cursor of each item type
+            complete: dict[str, bool] - whether the pagination of each item type is complete
+            qualifiers: str - additional search qualifiers
+            window: tuple[str, str] - only search the items last updated within the UTC window, an open end is None.
+                Default to the items updated since the timestamp
+        """
+        return ",".join(
+            source.partial_query(repo, timestamp, cursors.get(item_type), qualifiers, window)
+            for item_type, source in self.sources.items()
+            if not complete.get(item_type)
+        )
+
+    def read_result(self, graphql_result: dict, window: tuple[str, str] = None) -> dict[str, dict]:
+        """
+        read_result reads the result of each item type that was part of the query
+
+        args:
+            graphql_result: dict - the result of the query
+            window: tuple[str, str] - the window passed to partial_query, default to no window
+
+        returns:
+            dict[str, dict] - the search result of each item type
+        """
+        return {
+            item_type: source.read_result(graphql_result, window)
+            for item_type, source in self.sources.items()
+            if source.id in graphql_result
+        }
+
+    def count_query(self, repo: str, timestamp: str, qualifiers: str = "") -> str:
+        """
+        count_query returns the aliased queries counting the items of each type in the time range
+
+        args:
+            repo: str - the repository to search
+            timestamp: str - the UTC start of the time range
+            qualifiers: str - additional search qualifiers
+        """
+        return ",".join(counter.partial_query(repo, timestamp, qualifiers) for counter in self.counters.values())
+
+    def read_counts(self, graphql_result: dict) -> dict[str, int]:
+        """
+        read_counts reads the number of items of each type from the result of count_query
+
+        args:
+            graphql_result: dict - the result of the query
+        """
+        return {item_type: counter.get_count(graphql_result) for item_type, counter in self.counters.items()}
+
+    def activity_query(self, repo: str, timestamp: str, qualifiers: str = "") -> str:
+        """
+        activity_query returns the aliased queries counting the issues and pull requests opened and closed in the time range
+
+        args:
+            repo: str - the repository to search
+            timestamp: str - the UTC start of the time range
+            qualifiers: str - additional search qualifiers
+        """
+        return ",".join(
+            counter.partial_query(repo, timestamp, f"{qualifiers} {qualifier}:>={timestamp}")
+            for (_, qualifier), counter in self.activity_counters.items()
+        )
+
+    def read_activity(self, graphql_result: dict) -> dict[str, int]:
+        """
+        read_activity reads the number of items opened and closed from the result of activity_query
+
+        args:
+            graphql_result: dict - the result of the query
+        """
+        ret = {"opened": 0, "closed": 0}
+        for (_, qualifier), counter in self.activity_counters.items():
+            ret["opened" if qualifier == "created" else "closed"] += counter.get_count(graphql_result)
+        return ret
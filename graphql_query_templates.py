@@ -7,7 +7,6 @@ addComment(input: { subjectId: "$issue_id", body: "$comment_body" }) {
   commentEdge {
     node {
       id
-      body
     }
   }
 }
@@ -28,10 +27,171 @@ repository(owner: "$owner", name: "$repo") {
 }
 """)
 
+# the timeline events shown in the digest, shared by the search and the pagination of timeline events.
+# pull requests can also be merged
+timeline_item_types = "CLOSED_EVENT, REOPENED_EVENT, LABELED_EVENT, UNLABELED_EVENT, ASSIGNED_EVENT, UNASSIGNED_EVENT, CROSS_REFERENCED_EVENT"
+pr_timeline_item_types = "MERGED_EVENT, " + timeline_item_types
+
+timeline_event_fields = """
+          ... on ClosedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+          }
+          ... on ReopenedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+          }
+          ... on LabeledEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+            label {
+              name
+            }
+          }
+          ... on UnlabeledEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+            label {
+              name
+            }
+          }
+          ... on AssignedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+            assignee {
+              ... on User {
+                login
+              }
+            }
+          }
+          ... on UnassignedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+            assignee {
+              ... on User {
+                login
+              }
+            }
+          }
+          ... on CrossReferencedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+            source {
+              ... on Issue {
+                url
+                number
+              }
+              ... on PullRequest {
+                url
+                number
+              }
+            }
+          }
+"""
+
+timeline_fields = """
+        pageInfo {
+          endCursor
+          hasNextPage
+        }
+        nodes {
+          __typename""" + timeline_event_fields + """        }
+"""
+
+pr_timeline_fields = """
+        pageInfo {
+          endCursor
+          hasNextPage
+        }
+        nodes {
+          __typename
+          ... on MergedEvent {
+            id
+            createdAt
+            actor {
+              login
+            }
+          }""" + timeline_event_fields + """        }
+"""
+
+# the fields of an issue, shared by the search and the repository listing of issues and by the search of pull requests
+issue_fields = """
+      title
+      id
+      url
+      number
+      closed
+      closedAt
+      labels(first: 20) {
+        nodes {
+          name
+        }
+      }
+      milestone {
+        title
+      }
+      body
+      createdAt
+      updatedAt
+      author {
+        login
+      }
+      lastEditedAt
+      editor {
+        login
+      }
+  
+      comments(first: 100) {
+        pageInfo {
+          endCursor
+          hasNextPage
+        }
+        nodes {
+          id
+          author {
+            login
+          }
+          url
+          createdAt
+          lastEditedAt
+          body
+          editor {
+            login
+          }
+        }
+      }
+"""
+
+# the timeline of an issue since the start of the window
+issue_timeline_fields = """
+      timelineItems(first: 100, since: "$timestamp", itemTypes: [""" + timeline_item_types + """]) {""" + timeline_fields + """      }
+"""
+
 main_query_template = Template("""
 search(
   first: 100
-  query: "repo:$repo is:issue updated:>=$timestamp"
+  query: "repo:$repo is:issue updated:$updated$qualifiers"
   type: ISSUE
   after: $cursor
 ) {
@@ -40,11 +200,109 @@ search(
     hasNextPage
   }
   nodes {
-    ... on Issue {
+    ... on Issue {""" + issue_fields + issue_timeline_fields + """    }
+  }
+}
+""")
+
+repository_issues_template = Template("""
+repository(owner: "$owner", name: "$name") {
+  issues(
+    first: 100
+    after: $cursor
+    filterBy: {since: "$since"}
+    orderBy: {field: UPDATED_AT, direction: ASC}
+  ) {
+    pageInfo {
+      endCursor
+      hasNextPage
+    }
+    nodes {""" + issue_fields + issue_timeline_fields + """    }
+  }
+}
+""")
+
+# the newest reviews of a pull request and their comments, shared by the search and the pagination of reviews
+review_fields = """
+        pageInfo {
+          startCursor
+          hasPreviousPage
+        }
+        nodes {
+          id
+          author {
+            login
+          }
+          url
+          createdAt
+          lastEditedAt
+          body
+          editor {
+            login
+          }
+          comments(last: 100) {
+            nodes {
+              id
+              author {
+                login
+              }
+              url
+              createdAt
+              lastEditedAt
+              body
+              editor {
+                login
+              }
+            }
+          }
+        }
+"""
+
+pull_request_query_template = Template("""
+search(
+  first: 50
+  query: "repo:$repo is:pr updated:$updated$qualifiers"
+  type: ISSUE
+  after: $cursor
+) {
+  pageInfo {
+    endCursor
+    hasNextPage
+  }
+  nodes {
+    ... on PullRequest {""" + issue_fields + """
+      timelineItems(first: 100, since: "$timestamp", itemTypes: [""" + pr_timeline_item_types + """]) {""" + pr_timeline_fields + """      }
+
+      reviews(last: 50) {""" + review_fields + """      }
+    }
+  }
+}
+""")
+
+discussion_query_template = Template("""
+search(
+  first: 100
+  query: "repo:$repo updated:$updated$qualifiers"
+  type: DISCUSSION
+  after: $cursor
+) {
+  pageInfo {
+    endCursor
+    hasNextPage
+  }
+  nodes {
+    ... on Discussion {
       title
       id
       url
       number
+      closed
+      closedAt
+      labels(first: 20) {
+        nodes {
+          name
+        }
+      }
       body
       createdAt
       author {
@@ -54,13 +312,14 @@ search(
       editor {
         login
       }
-  
+
       comments(first: 100) {
         pageInfo {
           endCursor
           hasNextPage
         }
         nodes {
+          id
           author {
             login
           }
@@ -87,6 +346,49 @@ resource(url: "$url") {
                 hasNextPage
             }
             nodes{
+                id
+                author {
+                    login
+                }
+                url
+                createdAt
+                lastEditedAt
+                body
+                editor {
+                    login
+                }
+            }
+        }
+    }
+    ... on PullRequest {
+        comments(first:100, after: "$cursor") {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
+            nodes{
+                id
+                author {
+                    login
+                }
+                url
+                createdAt
+                lastEditedAt
+                body
+                editor {
+                    login
+                }
+            }
+        }
+    }
+    ... on Discussion {
+        comments(first:100, after: "$cursor") {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
+            nodes{
+                id
                 author {
                     login
                 }
@@ -103,6 +405,25 @@ resource(url: "$url") {
 }
 """)
 
+read_reviews_template = Template("""
+resource(url: "$url") {
+    ... on PullRequest {
+      reviews(last: 50, before: "$cursor") {""" + review_fields + """      }
+    }
+}
+""")
+
+read_timeline_template = Template("""
+resource(url: "$url") {
+    ... on Issue {
+      timelineItems(first: 100, after: "$cursor", since: "$timestamp", itemTypes: [""" + timeline_item_types + """]) {""" + timeline_fields + """      }
+    }
+    ... on PullRequest {
+      timelineItems(first: 100, after: "$cursor", since: "$timestamp", itemTypes: [""" + pr_timeline_item_types + """]) {""" + pr_timeline_fields + """      }
+    }
+}
+""")
+
 read_last_comment_template = Template("""
 node(id: "$issue_id") {
   ... on Issue {
@@ -123,10 +444,16 @@ updateIssue(input: {id: "$issue_id", body: "$issue_body"}) {
 }
 """)
 
-check_lock_state_template = Template("""
+read_digest_issue_template = Template("""
 node(id: "$issue_id") {
-  ... on Lockable {
+  ... on Issue {
     locked
+    body
+    comments(last: $count) {
+      nodes {
+        body
+      }
+    }
   }
 }
 """)
@@ -142,3 +469,55 @@ unlockLockable(input: {lockableId: "$issue_id",  clientMutationId: null} ) {
   clientMutationId
 }
 """)
+
+rate_limit_template = Template("""
+rateLimit(dryRun: $dry_run) {
+  cost
+  limit
+  remaining
+  resetAt
+}
+""")
+
+issue_count_template = Template("""
+search(first: 1, query: "repo:$repo is:issue updated:>=$timestamp$qualifiers", type: ISSUE) {
+  issueCount
+}
+""")
+
+updated_issue_numbers_template = Template("""
+search(first: $count, query: "repo:$repo is:issue updated:>=$timestamp", type: ISSUE) {
+  issueCount
+  nodes {
+    ... on Issue {
+      number
+      updatedAt
+    }
+  }
+}
+""")
+
+pull_request_count_template = Template("""
+search(first: 1, query: "repo:$repo is:pr updated:>=$timestamp$qualifiers", type: ISSUE) {
+  issueCount
+}
+""")
+
+discussion_count_template = Template("""
+search(first: 1, query: "repo:$repo updated:>=$timestamp$qualifiers", type: DISCUSSION) {
+  discussionCount
+}
+""")
+
+read_content_edits_template = Template("""
+node(id: "$item_id") {
+  ... on Comment {
+    userContentEdits(last: $count) {
+      nodes {
+        editedAt
+        diff
+      }
+    }
+  }
+}
+""")
@@ -0,0 +1,132 @@
+import heapq
+from git_structures import GitIssue, issue_title_template
+
+summary_template = "_{changes} changes, [read more]({link})_\n\n"
+read_more_template = "\n> ...\n\n[read more]({link})\n\n"
+hidden_template = "and {hidden} more"
+HIDDEN_NOTE_SIZE = 24 # room kept for the note of the issues not listed
+
+def activity_score(issue: GitIssue) -> int:
+    """
+    activity_score returns how much an issue changed, busier issues get more of the digest.
+
+    args:
+        issue: GitIssue - the issue to score
+    """
+    return max(issue.total_changes, 1)
+
+def minimum_entry(issue: GitIssue) -> str:
+    """
+    minimum_entry returns the shortest entry of an issue in the digest, its title and the number of changes.
+
+    args:
+        issue: GitIssue - the issue to render
+    """
+    return issue_title_template.format(title=issue.title, number=issue.number, link=issue.url) + \
+        summary_template.format(changes=issue.total_changes, link=issue.url)
+
+def truncate_block(block: str, limit: int, link: str) -> str:
+    """
+    truncate_block cuts the rendered issue at the last line that fits in the limit, followed by a link to the issue.
+
+    args:
+        block: str - the rendered issue
+        limit: int - the longest the truncated block can be
+        link: str - the link to the issue
+
+    returns:
+        str - the truncated block, empty if not even the first line fits
+    """
+    suffix = read_more_template.format(link=link)
+    cut = block.rfind("\n", 0, limit - len(suffix) + 1)
+    if cut <= 0:
+        return ""
+    return block[:cut] + suffix
+
+def allocate(needs: list[int], weights: list[int], budget: int) -> list[int]:
+    """
+    allocate shares the budget among the needs in proportion to the weights (weighted water filling).
+    Needs below their share are met in full, and what they leave is shared among the rest.
+
+    args:
+        needs: list[int] - the length each item would like
+        weights: list[int] - the weight of each item, all positive
+        budget: int - the length to share
+
+    returns:
+        list[int] - the length given to each item, in the same order as the needs
+    """
+    ret = [0] * len(needs)
+    total_weight = sum(weights)
+    for i in sorted(range(len(needs)), key=lambda i: needs[i] / weights[i]):
+        share = budget * weights[i] / total_weight
+        ret[i] = needs[i] if needs[i] <= share else int(share)
+        budget -= ret[i]
+        total_weight -= weights[i]
+    return ret
+
+def pack(issues: list[GitIssue], rendered: list[tuple[str, int]], budget: int) -> tuple[list[str], list[str], int]:
+    """
+    pack fits the issues into the length budget of a digest comment in O(n log n).
+
+    If everything fits, every issue is shown in full. Otherwise every issue is at least listed as a link, the
+    most active issues are shown with their title and number of changes, and the rest of the budget is shared
+    among them in proportion to their activity. Issues that get less than their full length are cut at a line
+    and followed by a link to read more.
+
+    args:
+        issues: list[GitIssue] - the issues in the order they are shown
+        rendered: list[tuple[str, int]] - the markdown of each issue with its length, see render_issues
+        budget: int - the length available for the issues
+
+    returns:
+        tuple[list[str], list[str], int] - the entries shown and the links of the issues not shown, both in the
+        order of the issues, and the number of issues that did not fit even as a link
+    """
+    if sum(length for _, length in rendered) <= budget:
+        return [block for block, _ in rendered], [], 0
+
+    n = len(issues)
+    links = [issue.simple_link for issue in issues]
+    remaining = budget - sum(len(link) + 1 for link in links)
+
+    heap = [(-activity_score(issue), i) for i, issue in enumerate(issues)]
+    heapq.heapify(heap)
+    ranked = [heapq.heappop(heap)[1] for _ in range(n)]
+
+    # drop the links of the least active issues if not even the links fit
+    hidden = set()
+    if remaining < 0:
+        remaining -= HIDDEN_NOTE_SIZE
+    for i in reversed(ranked):
+        if remaining >= 0:
+            break
+        hidden.add(i)
+        remaining += len(links[i]) + 1
+
+    minimums: dict[int, str] = {}
+    for i in ranked:
+        if i in hidden:
+            continue
+        entry = minimum_entry(issues[i])
+        if rendered[i][1] <= len(entry):
+            entry = rendered[i][0]
+        cost = len(entry) - len(links[i]) - 1
+        if cost <= remaining:
+            minimums[i] = entry
+            remaining -= cost
+
+    shown = sorted(minimums)
+    needs = [max(rendered[i][1] - len(minimums[i]), 0) for i in shown]
+    given = allocate(needs, [activity_score(issues[i]) for i in shown], remaining)
+
+    entries = []
+    for i, need, extra in zip(shown, needs, given):
+        if extra >= need:
+            entries.append(rendered[i][0] if need else minimums[i])
+            continue
+        truncated = truncate_block(rendered[i][0], len(minimums[i]) + extra, issues[i].url)
+        entries.append(truncated if len(truncated) > len(minimums[i]) else minimums[i])
+
+    omitted = [links[i] for i in range(n) if i not in minimums and i not in hidden]
+    return entries, omitted, len(hidden)
@@ -0,0 +1,131 @@
+import math
+import sys
+import time
+from datetime import datetime
+from digest_manager import DigestManager
+from gql_queries import RateLimit, item_page_sizes, run_queries
+import datetimehelper
+
+plan_template = """Digest plan for {repo} since {time_start}:
+{items}
+- {requests} search requests costing {points} points, about {duration:.0f}s
+- rate limit: {remaining}/{limit} points left, resets at {reset_at}
+Comment and timeline pagination of busy items is not included."""
+
+plan_item_template = "- {item_type}: {count} items in {pages} pages, {cost} points per page"
+
+class RunPlan:
+    """
+    RunPlan is the projected cost of the searches of a digest run.
+
+    args:
+        repo: str - the repository to monitor
+        time_start: datetime - the start of the time range
+        counts: dict[str, int] - the number of items of each type in the time range
+        page_costs: dict[str, int] - the points charged for a page of each type
+        rate_limit: dict - the rate limit of the token
+        latency: float - the seconds taken by a request
+    """
+    repo: str
+    time_start: datetime
+    counts: dict[str, int]
+    pages: dict[str, int]
+    page_costs: dict[str, int]
+    remaining: int
+    limit: int
+    reset_at: datetime
+    latency: float
+
+    def __init__(self, repo: str, time_start: datetime, counts: dict[str, int], page_costs: dict[str, int],
+                 rate_limit: dict, latency: float):
+        self.repo = repo
+        self.time_start = time_start
+        self.counts = counts
+        # an empty search still takes a request to find out that it is empty
+        self.pages = {item_type: max(1, math.ceil(count / item_page_sizes[item_type])) for item_type, count in counts.items()}
+        self.page_costs = page_costs
+        self.remaining = rate_limit["remaining"]
+        self.limit = rate_limit["limit"]
+        self.reset_at = datetimehelper.convertToDateTime(rate_limit["resetAt"])
+        self.latency = latency
+
+    @property
+    def requests(self) -> int:
+        # all item types are paginated jointly in the same requests
+        return max(self.pages.values())
+
+    @property
+    def points(self) -> int:
+        return sum(self.pages[item_type] * self.page_costs[item_type] for item_type in self.pages)
+
+    @property
+    def duration(self) -> float:
+        return self.requests * self.latency
+
+    @property
+    def exhausts_budget(self) -> bool:
+        return self.points > self.remaining
+
+    def report(self) -> str:
+        items = "\n".join(
+            plan_item_template.format(item_type=item_type, count=self.counts[item_type], pages=self.pages[item_type], cost=self.page_costs[item_type])
+            for item_type in self.counts
+        )
+        return plan_template.format(
+            repo=self.repo,
+            time_start=datetimehelper.format_local(self.time_start),
+            items=items,
+            requests=self.requests,
+            points=self.points,
+            duration=self.duration,
+            remaining=self.remaining,
+            limit=self.limit,
+            reset_at=datetimehelper.format_local(self.reset_at)
+        )
+
+def plan_run(ql: DigestManager) -> RunPlan:
+    """
+    plan_run counts the items the searches of the run would page through and asks GitHub for the cost
+    of a page of each item type without running the search.
+
+    args:
+        ql: DigestManager - the manager of the run to plan
+    """
+    timestamp = datetimehelper.format_to_utc(ql.last_update_time)
+    qualifiers = ql.filters.to_search_qualifiers()
+
+    start = time.monotonic()
+    res = run_queries([RateLimit("rate_limit").partial_query(), ql.query.count_query(ql.target_repo, timestamp, qualifiers)])
+    latency = time.monotonic() - start
+    counts = ql.query.read_counts(res)
+
+    page_costs = {}
+    for item_type, source in ql.query.sources.items():
+        cost = run_queries([RateLimit("rate_limit").partial_query(dry_run=True), source.partial_query(ql.target_repo, timestamp, None, qualifiers)])
+        page_costs[item_type] = cost["rate_limit"]["cost"]
+
+    return RunPlan(ql.target_repo, ql.last_update_time, counts, page_costs, res["rate_limit"], latency)
+
+def wait_for_budget(plan: RunPlan, max_wait: int) -> bool:
+    """
+    wait_for_budget waits for the rate limit to reset if the run would exhaust the budget.
+
+    args:
+        plan: RunPlan - the plan of the run
+        max_wait: int - the longest time to wait in minutes
+
+    returns:
+        bool - whether the run fits the budget
+    """
+    if not plan.exhausts_budget:
+        return True
+    if plan.points > plan.limit:
+        print(f"The run needs {plan.points} points, more than the rate limit of {plan.limit}.", file=sys.stderr)
+        return False
+    wait = max((plan.reset_at - datetimehelper.get_now()).total_seconds(), 0)
+    if wait > max_wait * 60:
+        print(f"The run needs {plan.points} points but only {plan.remaining} are left until {datetimehelper.format_local(plan.reset_at)}.", file=sys.stderr)
+        return False
+    print(f"Waiting {wait:.0f}s for the rate limit to reset.", file=sys.stderr)
+    time.sleep(wait + 1)
+    return True
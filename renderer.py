@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import multiprocessing
+import os
+from git_structures import GitIssue
+from gql_queries import GithubQuery
+import datetimehelper
+
+RENDER_CHUNK_SIZE = 64 # issues rendered per task sent to a worker process
+# measured costs in microseconds, per issue and per character of its body and comments (from 65 to 16k characters per issue).
+# Sending an issue to a worker and its markdown back costs about a quarter of rendering it, and starting a worker about 0.1s,
+# so the workers only pay off for thousands of long issues on several CPUs.
+RENDER_COST = (20, 0.13)
+TRANSFER_COST = (25, 0.03)
+WORKER_START_COST = 100_000
+RENDER_CACHE_SIZE = 4096 # rendered issues kept between digests of the same process
+
+render_cache: OrderedDict[tuple, tuple[str, int]] = OrderedDict()
+render_cache_stats = {"hits": 0, "misses": 0}
+
+def render_key(issue: GitIssue) -> tuple:
+    """
+    render_key returns a key that changes whenever the markdown of the issue would change.
+
+    args:
+        issue: GitIssue - the issue to render
+    """
+    return (
+        issue.id,
+        issue.title,
+        issue.last_change_date,
+        issue.contains_changes,
+        issue.time_range,
+        datetimehelper.localtz.zone,
+        issue.previous_body,
+        tuple((comment.id, comment.last_change_date, comment.previous_body) for comment in issue.comments),
+        tuple(event.id for event in issue.events),
+    )
+
+def worker_copy(issue: GitIssue) -> GitIssue:
+    """
+    worker_copy returns a copy of the issue with only what rendering needs, to keep the chunks sent to the
+    worker processes small. The digested map of the run is cut down to the entry of the issue itself,
+    and the pagination queries are dropped.
+
+    args:
+        issue: GitIssue - the issue to copy
+    """
+    ret = copy.copy(issue)
+    ret.digested = {issue.id: issue.digested[issue.id]} if issue.id in issue.digested else {}
+    for name, value in vars(issue).items():
+        if isinstance(value, GithubQuery):
+            setattr(ret, name, None)
+    return ret
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def use_workers(issues: list[GitIssue], workers: int) -> bool:
+    """
+    use_workers returns true if rendering the issues over the worker processes is estimated to be faster
+    than rendering them in the current process, see RENDER_COST.
+
+    args:
+        issues: list[GitIssue] - the issues to render
+        workers: int - the number of worker processes
+    """
+    if workers <= 1:
+        return False
+    chars = sum(len(issue.body) + sum(len(comment.body) for comment in issue.comments) for issue in issues)
+    serial = RENDER_COST[0] * len(issues) + RENDER_COST[1] * chars
+    parallel = WORKER_START_COST * workers + serial / workers + TRANSFER_COST[0] * len(issues) + TRANSFER_COST[1] * chars
+    return parallel < serial
+
+def render_chunk(issues: list[GitIssue]) -> list[tuple[str, int]]:
+    """
+    render_chunk renders a chunk of issues to markdown.
+
+    args:
+        issues: list[GitIssue] - the issues to render
+
+    returns:
+        list[tuple[str, int]] - the markdown of each issue with its length, in the same order as the input
+    """
+    ret = []
+    for issue in issues:
+        block = issue.to_markdown()
+        ret.append((block, len(block)))
+    return ret
+
+def render_issues(issues: list[GitIssue], workers: int = None) -> list[tuple[str, int]]:
+    """
+    render_issues renders the issues to markdown blocks.
+
+    Issues rendered before by this process (e.g. for another digest target, or a previous cycle of the daemon)
+    are taken from the cache. Inputs large enough to repay the workers are split into chunks and rendered over
+    a process pool, others are rendered in the current process. The output order always follows the input order.
+    The workers are started by a fork server, since forking the threaded daemon is not safe.
+
+    args:
+        issues: list[GitIssue] - the issues to render
+        workers: int - the number of worker processes, default to the number of CPUs available
+
+    returns:
+        list[tuple[str, int]] - the markdown of each issue with its length, in the same order as the input
+    """
+    keys = [render_key(issue) for issue in issues]
+    found: dict[tuple, tuple[str, int]] = {}
+    missing: list[GitIssue] = []
+    for key, issue in zip(keys, issues):
+        if key in render_cache:
+            render_cache.move_to_end(key)
+            found[key] = render_cache[key]
+        elif key not in found:
+            found[key] = None
+            missing.append(issue)
+    render_cache_stats["hits"] += len(issues) - len(missing)
+    render_cache_stats["misses"] += len(missing)
+
+    workers = workers or available_cpus()
+    if not use_workers(missing, workers):
+        rendered = render_chunk(missing)
+    else:
+        slim = [worker_copy(issue) for issue in missing]
+        chunks = [slim[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(slim), RENDER_CHUNK_SIZE)]
+        rendered = []
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as executor:
+            for chunk in executor.map(render_chunk, chunks):
+                rendered.extend(chunk)
+
+    for issue, block in zip(missing, rendered):
+        key = render_key(issue)
+        found[key] = block
+        render_cache[key] = block
+    while len(render_cache) > RENDER_CACHE_SIZE:
+        render_cache.popitem(last=False)
+
+    return [found[key] for key in keys]
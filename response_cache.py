@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+DEFAULT_TTL = 7 * 24 * 60 * 60 # seconds, only immutable facts such as node ids are cached
+DEFAULT_MAX_ENTRIES = 1024
+
+class ResponseCache:
+    """
+    ResponseCache is an on-disk cache of GraphQL results that do not change, such as the node ids of the repository
+    and of the digest issues. Entries expire after a time to live, and the least recently used entries are evicted
+    once the cache is full. The file is only rewritten when an entry was added.
+
+    args:
+        path: str - the path of the cache file
+        ttl: int - the time to live of an entry in seconds
+        max_entries: int - the maximum number of entries kept
+    """
+    path: str
+    ttl: int
+    max_entries: int
+    entries: dict[str, dict]
+    hits: int
+    misses: int
+    changed: bool
+
+    def __init__(self, path: str, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                try:
+                    self.entries = json.load(f)
+                except json.decoder.JSONDecodeError:
+                    # the cache can always be rebuilt
+                    self.entries = {}
+
+    def get(self, key: str) -> dict | None:
+        """
+        get returns the cached result of the key, or None if it is missing or expired.
+
+        args:
+            key: str - the key of the result, e.g. "repo_id:owner/repo"
+        """
+        entry = self.entries.get(key)
+        now = time.time()
+        if entry is None or now - entry["stored"] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["used"] = now
+        return entry["value"]
+
+    def put(self, key: str, value: dict):
+        """
+        put stores the result of the key, evicting the least recently used entries if the cache is full.
+
+        args:
+            key: str - the key of the result
+            value: dict - the result to store
+        """
+        now = time.time()
+        self.entries[key] = {"stored": now, "used": now, "value": value}
+        if len(self.entries) > self.max_entries:
+            by_use = sorted(self.entries, key=lambda k: self.entries[k]["used"])
+            for k in by_use[:len(self.entries) - self.max_entries]:
+                del self.entries[k]
+        self.changed = True
+
+    def save(self):
+        """
+        save atomically writes the cache to disk if an entry was added.
+        """
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    @property
+    def report(self) -> str:
+        """
+        report returns a one line summary of the hit rate.
+        """
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
@@ -0,0 +1,133 @@
+import glob
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from git_structures import GitIssue, item_classes
+import datetimehelper
+
+def partition(repos: list[str], split: int, index: int, count: int) -> list[tuple[str, int]]:
+    """
+    partition returns the work of one shard. Each repository is split into a number of time windows,
+    and the windows of all repositories are dealt out to the shards in turn.
+    The partition only depends on its arguments, so every shard agrees on it.
+
+    args:
+        repos: list[str] - the repositories to monitor
+        split: int - the number of time windows each repository is split into
+        index: int - the index of the shard, starting from 0
+        count: int - the number of shards
+
+    returns:
+        list[tuple[str, int]] - the repository and time window pairs of the shard
+    """
+    units = [(repo, window) for repo in sorted(set(repos)) for window in range(split)]
+    return units[index::count]
+
+def window_end(now: datetime) -> datetime:
+    """
+    window_end returns the time the windows are split up to when no split end is shared by the shards.
+    It is the start of the hour, so that shards started within the same hour split the windows at the same points.
+
+    args:
+        now: datetime - the current time
+    """
+    return now.replace(minute=0, second=0, microsecond=0)
+
+def search_window(start: datetime, end: datetime, window: int, split: int) -> tuple[datetime, datetime | None]:
+    """
+    search_window returns the update time range searched by one time window. The last window is
+    open ended, so items updated while the shards run are not lost.
+
+    args:
+        start: datetime - the start of the digest window
+        end: datetime - the time the windows are split up to, see window_end
+        window: int - the index of the time window
+        split: int - the number of time windows
+    """
+    step = max(end - start, timedelta(0)) / split
+    return (start + step * window, start + step * (window + 1) if window < split - 1 else None)
+
+def partial_path(prefix: str, window: int) -> str:
+    return f"{prefix}.shard-{window}.json"
+
+def write_partial(prefix: str, window: int, split: int, time_range: tuple[datetime, datetime],
+                  bounds: tuple[datetime, datetime | None], issues: list[GitIssue]):
+    """
+    write_partial atomically writes the items found by one time window.
+
+    args:
+        prefix: str - the prefix of the files kept for the repository
+        window: int - the index of the time window
+        split: int - the number of time windows
+        time_range: tuple[datetime, datetime] - the window of the run
+        bounds: tuple[datetime, datetime | None] - the update time range searched, see search_window
+        issues: list[GitIssue] - the items found
+    """
+    path = partial_path(prefix, window)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({
+            "window": window,
+            "split": split,
+            "time_start": datetimehelper.format_to_utc(time_range[0]),
+            "fetch_start": datetimehelper.format_to_utc(time_range[1]),
+            "window_start": datetimehelper.format_to_utc(bounds[0]),
+            "window_end": datetimehelper.format_to_utc(bounds[1]) if bounds[1] else None,
+            "items": [issue.to_dict() for issue in issues]
+        }, f)
+    os.replace(tmp, path)
+
+def read_partials(prefix: str) -> list[dict]:
+    """
+    read_partials reads the partial results of all time windows of a repository.
+
+    args:
+        prefix: str - the prefix of the files kept for the repository
+
+    returns:
+        list[dict] - the partial results in the order of the time windows, empty if some time windows are missing,
+        the results were made from different digest windows, or the time windows leave a gap or overlap
+    """
+    partials = []
+    for path in sorted(glob.glob(f"{glob.escape(prefix)}.shard-*.json")):
+        with open(path, 'r') as f:
+            partials.append(json.load(f))
+    if not partials:
+        return []
+    split = partials[0]["split"]
+    if sorted(partial["window"] for partial in partials) != list(range(split)):
+        return []
+    if len({(partial["split"], partial["time_start"]) for partial in partials}) != 1:
+        return []
+    partials.sort(key=lambda partial: partial["window"])
+    # shards that split at different points would silently miss the items updated between their windows
+    bounds = [partials[0]["time_start"]] + [partial.get("window_end") for partial in partials]
+    if bounds[-1] is not None or any(partial.get("window_start") != start for partial, start in zip(partials, bounds)):
+        print(f"Time windows of {prefix} do not join up, the shards split them at different points.", file=sys.stderr)
+        return []
+    return partials
+
+def merge_partials(partials: list[dict], digested: dict[str, str] = None) -> tuple[datetime, list[GitIssue]]:
+    """
+    merge_partials combines the items of the time windows. An item updated exactly on the boundary of
+    two windows is found by both, only one copy is kept.
+
+    args:
+        partials: list[dict] - the partial results, see read_partials
+        digested: dict[str, str] - mapping of item id to the last change already reported
+
+    returns:
+        tuple[datetime, list[GitIssue]] - the earliest time a shard started fetching, and the items
+    """
+    fetch_start = min(datetimehelper.convertToDateTime(partial["fetch_start"]) for partial in partials)
+    time_range = (datetimehelper.convertToDateTime(partials[0]["time_start"]), fetch_start)
+    merged = {}
+    for partial in partials:
+        for raw in partial["items"]:
+            merged[raw["id"]] = raw
+    return fetch_start, [item_classes[raw["item_type"]](raw, time_range, digested) for raw in merged.values()]
+
+def remove_partials(prefix: str):
+    for path in glob.glob(f"{glob.escape(prefix)}.shard-*.json"):
+        os.remove(path)
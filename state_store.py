@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+
+STATE_FILE = "digest.state.json"
+STATE_VERSION = 1
+
+class StateStore:
+    """
+    StateStore keeps the digest settings of every repository in a single file of the digest directory.
+
+    The file is read once, and the settings of a repository are looked up by name. It is only rewritten
+    when a setting changed, by writing a temporary file and renaming it over the old one, so a failed run
+    never leaves a partly written file. Each repository is kept on its own line to keep diffs small.
+    Settings in the older per repository files are moved into the store the first time they are read.
+    A file that cannot be read stops the program instead of being reset, since that would lose the digest issue
+    and create a duplicate one.
+
+    args:
+        path: str - the path of the state file
+    """
+    path: str
+    repos: dict[str, dict]
+    saved: str
+    migrated: list[str]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.migrated = []
+        self.saved = ""
+        self.repos = {}
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            self.saved = f.read()
+        try:
+            state = json.loads(self.saved)
+            self.repos = state["repos"]
+        except (json.decoder.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"State file {path} is invalid ({e}), fix or remove it to start over.", file=sys.stderr)
+            exit(1)
+
+    def get(self, repo: str, legacy_path: str = None, default: dict = None) -> dict:
+        """
+        get returns the setting of a repository, the returned dict can be changed in place and is saved by save.
+
+        args:
+            repo: str - the repository, in the format of owner/repo
+            legacy_path: str - the per repository setting file to move into the store if the repository is new
+            default: dict - the setting of a new repository
+
+        returns:
+            dict - the setting of the repository
+        """
+        if repo not in self.repos:
+            if legacy_path and os.path.exists(legacy_path):
+                with open(legacy_path, 'r') as f:
+                    try:
+                        self.repos[repo] = json.load(f)
+                    except json.decoder.JSONDecodeError as e:
+                        print(f"Setting file {legacy_path} is invalid ({e}), fix or remove it to start over.", file=sys.stderr)
+                        exit(1)
+                self.migrated.append(legacy_path)
+            else:
+                self.repos[repo] = dict(default or {})
+        return self.repos[repo]
+
+    def dumps(self) -> str:
+        lines = [f"{json.dumps(repo)}: {json.dumps(setting, sort_keys=True)}" for repo, setting in sorted(self.repos.items())]
+        return f'{{"version": {STATE_VERSION}, "repos": {{\n' + ",\n".join(lines) + "\n}}\n"
+
+    def save(self) -> bool:
+        """
+        save writes the store if a setting changed, and removes the per repository files moved into it.
+
+        returns:
+            bool - whether the store was written
+        """
+        content = self.dumps()
+        changed = content != self.saved
+        if changed:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.saved = content
+        for legacy_path in self.migrated:
+            os.remove(legacy_path)
+        self.migrated = []
+        return changed
@@ -1,7 +1,31 @@
+import difflib
 import re
 
-codeblock_regex = re.compile(r"```.*?```", re.DOTALL)
-link_regex = re.compile(r"!?\[[^\n\]]*\]\(\s*[^\)\s]*\s*\)")
+MENTION_SIGN = "＠"
+
+# an opening or closing code fence, indented by at most 3 spaces
+fence_regex = re.compile(r" {0,3}(`{3,}|~{3,})")
+# the inline tokens that have to be kept as they are, followed by mentions.
+# At each position the first alternative that matches wins, so an @ inside code, links and urls is never a mention.
+# An @ in an email follows a word character, which a mention cannot
+inline_regex = re.compile(r"""
+    (?P<code>(`+).+?(?<!`)\2(?!`))
+    |(?P<link>!?\[[^\n\]]*\]\(\s*[^\)\s]*\s*\))
+    |(?P<url><?https?://[^\s>]+>?)
+    |(?<![\w@.+-])@(?P<mention>[A-Za-z0-9][\w-]*(?:/[\w.-]+)?)
+""", re.VERBOSE)
+# the inline tokens of inline_regex alone. The lookahead skips the characters that cannot start one without trying each alternative
+protected_regex = re.compile(r"""(?=[`!\[<h])(?:
+    (`+).+?(?<!`)\1(?!`)
+    |!?\[[^\n\]]*\]\(\s*[^\)\s]*\s*\)
+    |<?https?://[^\s>]+>?
+)""", re.VERBOSE)
+# a mention that could run into a url
+mention_url_regex = re.compile(f"{MENTION_SIGN}[\\w./-]*https?:")
+# a placeholder that does not start a mention, by the same rules as inline_regex
+not_mention_regex = re.compile(f"{MENTION_SIGN}(?:(?<=[\\w{MENTION_SIGN}.+-]{MENTION_SIGN})|(?![A-Za-z0-9]))")
+
+truncated_marker = ">\n> ..."
 
 escape_trans = str.maketrans({
         '\\': '\\\\',
@@ -13,21 +37,108 @@ escape_trans = str.maketrans({
         '\f': '\\f'
     })
 
-def replace_references(x: str) -> str:
+def neutralise_mention(match: re.Match) -> str:
+    if match.group("mention"):
+        return MENTION_SIGN + match.group("mention")
+    return match.group(0)
+
+def restore_mentions(match: re.Match) -> str:
+    return match.group(0).replace(MENTION_SIGN, "@")
+
+def neutralise_mentions(line: str) -> str:
     """
-    replace_references replaces all @ sign in the given string with a placeholder ＠ which will
-    not trigger Github's markdown parser to reference the actual user.
+    neutralise_mentions replaces the @ of every mention in a line outside of code blocks with the placeholder ＠.
+
+    Every @ is replaced at once, and the ones that do not start a mention or are inside code, links and urls are put back.
+    Calling back for every mention instead made bodies full of mentions many times slower.
+    A line that already holds the placeholder is tokenized with inline_regex, so that its own placeholders are kept,
+    and so is a line where a mention such as @https runs into a url, since inline_regex reads the mention first.
+
+    args:
+        line: str - the line to change
     """
-    return x.replace("@", "＠")
+    if MENTION_SIGN in line:
+        return inline_regex.sub(neutralise_mention, line)
+    replaced = not_mention_regex.sub("@", line.replace("@", MENTION_SIGN))
+    if "http" in replaced and mention_url_regex.search(replaced):
+        return inline_regex.sub(neutralise_mention, line)
+    if "`" in replaced or "](" in replaced or "http" in replaced:
+        replaced = protected_regex.sub(restore_mentions, replaced)
+    return replaced
 
-def format_to_quote(x: str) -> str:
+def sanitize_markdown(x: str, limit: int = None) -> str:
     """
-    format_to_quote formats the string to a markdown quote.
+    sanitize_markdown formats the body of an issue or comment as a markdown quote in a single pass over its lines.
+
+    Mentions in prose are replaced with a placeholder ＠ which will not trigger Github's markdown parser to
+    reference the actual user. Fenced code, inline code, links, urls and emails are kept as they are.
+    If the quote is longer than the limit, it is cut at the last blank line outside of code blocks that fits,
+    or inside the line that does not fit if there is none.
 
     args:
         x: str - the string to be formatted
+        limit: int - the longest the quote can be, default to no limit
+
+    returns:
+        str - the quote
+    """
+    out: list[str] = []
+    size = 0
+    boundary = 0 # number of lines up to the last blank line outside of code blocks
+    fence = None # the opening fence of the code block the line is in
+    for line in x.split("\n"):
+        match = fence_regex.match(line)
+        if fence:
+            closing = match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) and not line[match.end():].strip()
+        elif match:
+            closing = False
+        elif "@" in line:
+            line = neutralise_mentions(line)
+
+        if limit is not None and size + len(line) + 2 > limit - len(truncated_marker):
+            if boundary:
+                # the marker starts with a blank line of its own
+                out = out[:boundary - 1]
+            else:
+                # no blank line to cut at, so the line itself is cut, unless it would open a code block
+                room = limit - len(truncated_marker) - size - 2 - (len(fence) + 2 if fence else 0)
+                if room > 0 and (fence or not match):
+                    out.append(">" + line[:room])
+                if fence:
+                    out.append(">" + fence)
+            out.append(truncated_marker)
+            break
+
+        out.append(">" + line)
+        size += len(line) + 2
+        if fence:
+            if closing:
+                fence = None
+        elif match:
+            fence = match.group(1)
+        elif not line.strip():
+            boundary = len(out)
+    return "\n".join(out)
+
+def format_diff(old: str, new: str, limit: int) -> str | None:
+    """
+    format_diff formats the line changes between two versions of a body as a quoted diff block.
+
+    args:
+        old: str - the earlier version
+        new: str - the current version
+        limit: int - the longest the diff can be
+
+    returns:
+        str | None - the quoted diff, or None if nothing changed or the diff is longer than the limit
     """
-    return ">"+x.replace("\n", "\n>")
+    lines = list(difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=1))[2:] # skip the file headers
+    if not lines:
+        return None
+    # the fence has to be longer than any run of backticks in the diff
+    fence = "`" * max(3, max((len(run) for run in re.findall(r"`+", new + old)), default=0) + 1)
+    diff = sanitize_markdown(f"{fence}diff\n" + "\n".join(lines) + f"\n{fence}")
+    return diff if len(diff) <= limit else None
 
 def escape_special_chars(s: str) -> str:
     """
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubGraphQL(BaseHTTPRequestHandler):
+    """
+    StubGraphQL answers every GraphQL request with an empty result, so that nothing reaches GitHub.
+    """
+    requests = 0
+
+    def do_POST(self):
+        StubGraphQL.requests += 1
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({"data": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+stub = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphQL)
+threading.Thread(target=stub.serve_forever, daemon=True).start()
+# the endpoint is read when the queries are imported
+os.environ["GITHUB_GRAPHQL_URL"] = f"http://127.0.0.1:{stub.server_address[1]}/graphql"
+os.environ.setdefault("GIT_SECRET", "test")
+os.environ.setdefault("TIMEZONE", "UTC")
+
+from daemon import CronSchedule, Daemon
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+class CronScheduleTest(unittest.TestCase):
+    def test_every_day(self):
+        self.assertEqual(CronSchedule("30 6 * * *").next_run(utc(2024, 1, 1, 7)), utc(2024, 1, 2, 6, 30))
+
+    def test_next_run_is_strictly_after(self):
+        self.assertEqual(CronSchedule("0 0 * * *").next_run(utc(2024, 1, 1)), utc(2024, 1, 2))
+
+    def test_day_of_month_or_day_of_week(self):
+        # both fields restricted: the 15th, or any monday
+        schedule = CronSchedule("0 0 15 * 1")
+        self.assertEqual(schedule.next_run(utc(2024, 1, 2)), utc(2024, 1, 8))
+        self.assertEqual(schedule.next_run(utc(2024, 1, 8)), utc(2024, 1, 15))
+        self.assertEqual(schedule.next_run(utc(2024, 1, 15)), utc(2024, 1, 22))
+
+    def test_restricted_day_of_week_only(self):
+        # 2024-01-01 is a monday
+        self.assertEqual(CronSchedule("0 0 * * 1").next_run(utc(2024, 1, 1)), utc(2024, 1, 8))
+
+    def test_seven_is_sunday(self):
+        self.assertEqual(CronSchedule("0 0 * * 7").weekdays, {0})
+        self.assertEqual(CronSchedule("0 0 * * 5-7").weekdays, {5, 6, 0})
+        self.assertEqual(CronSchedule("0 0 * * 7").next_run(utc(2024, 1, 1)), utc(2024, 1, 7))
+
+    def test_lists_ranges_and_steps(self):
+        schedule = CronSchedule("*/15 9-10 * * 1,3")
+        self.assertEqual(schedule.minutes, {0, 15, 30, 45})
+        self.assertEqual(schedule.hours, {9, 10})
+        self.assertEqual(schedule.weekdays, {1, 3})
+
+    def test_never_matches(self):
+        with self.assertRaises(ValueError):
+            CronSchedule("0 0 31 2 *").next_run(utc(2024, 1, 1))
+
+    def test_invalid_expressions(self):
+        for expression in ("0 0 * *", "60 0 * * *", "0 0 0 * *", "0 0 * 13 *", "0 0 * * 8"):
+            with self.assertRaises(ValueError, msg=expression):
+                CronSchedule(expression)
+
+class DaemonEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.save = tempfile.mkdtemp()
+        self.daemon = Daemon({"port": 0, "schedules": [
+            {"repo": "owner/repo", "cron": "0 0 * * *", "save": self.save},
+            {"repo": "owner/repo", "cron": "0 12 * * 1", "save": self.save},
+        ]})
+        self.server = self.daemon.serve()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path: str) -> tuple[str, str]:
+        with urllib.request.urlopen(self.url + path) as response:
+            return response.headers["Content-Type"], response.read().decode()
+
+    def test_health(self):
+        content_type, body = self.get("/health")
+        self.assertEqual(content_type, "application/json")
+        self.assertEqual(json.loads(body), {"status": "ok", "schedules": 2})
+
+    def test_metrics_of_every_schedule(self):
+        content_type, body = self.get("/metrics")
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn("digest_uptime_seconds", body)
+        self.assertIn('digest_runs_total{repo="owner/repo",schedule="0 0 * * *"} 0', body)
+        self.assertIn('digest_runs_total{repo="owner/repo",schedule="0 12 * * 1"} 0', body)
+
+    def test_failed_run_is_counted(self):
+        requests = StubGraphQL.requests
+        # the stub returns no data, so the digest fails
+        self.daemon.digests[0].run(self.daemon.lock)
+        self.assertGreater(StubGraphQL.requests, requests)
+        _, body = self.get("/metrics")
+        self.assertIn('digest_runs_total{repo="owner/repo",schedule="0 0 * * *"} 1', body)
+        self.assertIn('digest_failures_total{repo="owner/repo",schedule="0 0 * * *"} 1', body)
+        self.assertIn('digest_failures_total{repo="owner/repo",schedule="0 12 * * 1"} 0', body)
+
+    def test_unknown_path(self):
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.get("/other")
+        self.assertEqual(error.exception.code, 404)
+
+if __name__ == "__main__":
+    unittest.main()